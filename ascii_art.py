@@ -1,7 +1,8 @@
 import numpy as np
-from PIL import ImageFont, Image, ImageDraw, ImageEnhance
+from PIL import ImageFont, Image, ImageDraw
 from colour import Color
-from math import floor
+from tone_adjust import build_tone_lut, apply_lut
+from image_loading import load_pixels
 
 SAMPLE_LETTER = "x"  # Used to determine the typical width and height of an ASCII character
 BRIGHTNESS_FACTOR = 1.5  # How much to brighten image by
@@ -65,12 +66,28 @@ def get_tile(img, w_start, h_start, w_end, h_end):
     return np.array(tile)
 
 
+def tile_brightness(img, letters_per_row, letters_per_col, letter_width, letter_height):
+    """
+    Vectorized version of get_tile and avg_tile_brightness for every tile in the image at once
+    :param img: an image represented as a 2-dimensional numpy array of grayscale values
+    :return: a 2-dimensional numpy array (letters_per_col by letters_per_row) holding the average grayscale value
+    of every tile
+    """
+    tiles = img[:letters_per_col * letter_height, :letters_per_row * letter_width]  # Drop pixels that don't fill a tile
+    tiles = tiles.reshape(letters_per_col, letter_height, letters_per_row, letter_width)
+
+    return tiles.mean(axis=(1, 3))
+
+
 def brighten(img):
-    """Brightens an image object and returns the brightened version as a numpy array"""
-    enhancer = ImageEnhance.Brightness(img)
-    img = enhancer.enhance(BRIGHTNESS_FACTOR)
+    """Brightens an image object or a numpy array of grayscale values and returns the brightened version as a numpy
+    array; writable numpy arrays are brightened in place"""
+    if isinstance(img, np.ndarray) and img.flags.writeable:
+        np_img = img
+    else:
+        np_img = np.array(img)
 
-    return np.array(img)
+    return apply_lut(np_img, build_tone_lut(brightness=BRIGHTNESS_FACTOR), out=np_img)
 
 
 def create_gradients(start_color, end_color, num_lines):
@@ -87,7 +104,8 @@ def create_gradients(start_color, end_color, num_lines):
     return list(start.range_to(end, num_lines))
 
 
-def draw_to_image(img, letters_per_row, letters_per_col, letter_width, letter_height, grayscale, color_gradients, draw):
+def draw_to_image(img, letters_per_row, letters_per_col, letter_width, letter_height, grayscale, color_gradients, draw,
+                  cancel_token=None, progress=None):
     """
     draws to the new image line by line
     :param img: an image represented as 3-dimensional numpy as grayscale values
@@ -100,40 +118,32 @@ def draw_to_image(img, letters_per_row, letters_per_col, letter_width, letter_he
     :param color_gradients: A list of colors where the first color in the list gradually becomes more like the last
     color in the list
     :param draw: An ImageDraw.draw object used to draw to the new image
+    :param cancel_token: Optional CancelToken from multithreading; checked before every line is drawn
+    :param progress: Optional function that's called with a message every time the percentage of lines drawn changes
     :return: nothing; the function simply draws to the new image
     """
     line_index = 0  # First line of the image
     y = 0  # The current distance from the very top of the image, starts at 0
+    percent_done = 0
 
-    col_pixel_count = 0  # The number of pixels processed vertically
-    col_end_count = 0  # Used to determine the value of the last pixel for each given tile, vertically
+    avg_brightness = tile_brightness(img, letters_per_row, letters_per_col, letter_width, letter_height)
+    indices = (((len(grayscale) - 1) * avg_brightness) // 255).astype(int)  # Convert grayscale values to indexes
 
     for row in range(0, letters_per_col):
-        col_end_count += letter_height
-
-        row_pixel_count = 0  # The number of pixels processed horizontally
-        row_end_count = 0  # Used to determine the value of the last pixel for each given tile, horizontally
-
-        line = ""  # Begin a new line
+        if cancel_token is not None:
+            cancel_token.check()
 
-        for col in range(0, letters_per_row):
-            row_end_count += letter_width
-
-            tile = get_tile(img, row_pixel_count, col_pixel_count, row_end_count, col_end_count)  # Get image tile
-
-            avg_brightness = avg_tile_brightness(tile)  # Determine average brightness of the tile
-            i = floor((((len(grayscale) - 1) * avg_brightness) // 255))  # Convert grayscale value as an index
-
-            line += grayscale[i]  # Add one of the ASCII characters in grayscale to the current line of the image
-
-            row_pixel_count += letter_width  # Update the number of pixels processed
+        line = "".join([grayscale[i] for i in indices[row]])  # One ASCII character per tile in this row
 
         col = color_gradients[line_index]  # Determine the current color gradient
         draw.text((0, y), line, col.hex)  # Draw the line to the image in color col
 
         y += letter_height  # Update y; next line should be letter_height distance from previous line
         line_index += 1  # Update line index for color_gradients list
-        col_pixel_count += letter_height
+
+        if progress is not None and (100 * line_index) // letters_per_col != percent_done:
+            percent_done = (100 * line_index) // letters_per_col
+            progress("Creating your image... " + str(percent_done) + "%")
 
 
 def check_color(col1, col2, col3):
@@ -171,11 +181,12 @@ def execute_infile(old_name, new_name, start_color, end_color, bgcolor):
     print("Image created successfully")
 
 
-def ascii_art(label, path, start_color, end_color, bgcolor):
+def ascii_art(label, path, start_color, end_color, bgcolor, max_size=None, cancel_token=None, progress=None):
+    """Recreates an image out of ASCII characters; path is an image file or an already loaded numpy array (see
+    load_pixels). If max_size is given, the image is first shrunk to fit within max_size by max_size pixels"""
     start_color, end_color, bgcolor = check_color(start_color, end_color, bgcolor)
 
-    img = Image.open(path).convert("L")  # Open the image as grayscale values
-    np_img = brighten(img)  # Brighten and convert to numpy array
+    np_img = brighten(load_pixels(path, "L", max_size))  # Brightened in place
 
     w, h = get_width_height(np_img)  # Width and height of current image
 
@@ -189,7 +200,7 @@ def ascii_art(label, path, start_color, end_color, bgcolor):
     draw = ImageDraw.Draw(new_img)  # Create an object that'll allow us to draw to new_img
 
     draw_to_image(np_img, letters_per_row, letters_per_col, letter_width, letter_height, lvls_grayscale,
-                  color_gradients, draw)  # Draw to the image
+                  color_gradients, draw, cancel_token, progress)  # Draw to the image
 
     return new_img, label
 
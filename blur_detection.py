@@ -0,0 +1,197 @@
+import os
+import csv
+import multiprocessing
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from image_saving import temp_file_for, replace_file, PIL_FORMATS
+from image_loading import load_pixels
+
+SCORE_SIZE = 512  # Images are decoded at roughly this size; blur is still obvious and JPEGs decode several times faster
+TILE_SIZE = 32  # Side length, in pixels of the decoded image, of each tile in the sharpness heatmap
+BATCH_SIZE = 32  # Number of files scored by a worker process per task, which keeps inter-process overhead low
+CSV_FIELDS = ["rank", "sharpness", "path"]
+
+
+def laplacian(gray):
+    """
+    Applies the 3x3 Laplacian kernel (the four neighbors minus four times the center) to every pixel not on the edge
+    of the image, using shifted slices of the whole array instead of looping over pixels
+
+    :param gray: A 2-dimensional numpy array of grayscale values
+    :return: A float32 numpy array two pixels narrower and shorter than gray
+    """
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        raise ValueError("The image must be at least 3 pixels wide and tall")
+
+    gray = gray.astype(np.float32)
+    center = gray[1:-1, 1:-1]
+
+    return gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * center
+
+
+def sharpness(gray):
+    """Returns the variance of the Laplacian of an image; sharp edges give large values, blurry images small ones"""
+    return float(laplacian(gray).var())
+
+
+def tile_sharpness(gray, tile_size=TILE_SIZE):
+    """
+    Computes the sharpness of every tile_size by tile_size tile of an image, so blur in only part of the image
+    (a missed focus, motion of one subject, ...) can be found
+
+    :return: A 2-dimensional numpy array holding the Laplacian variance of every tile; pixels that don't fill a whole
+    tile at the right and bottom edges are left out
+    """
+    lap = laplacian(gray)
+    tile_size = min(tile_size, lap.shape[0], lap.shape[1])
+
+    rows, cols = lap.shape[0] // tile_size, lap.shape[1] // tile_size
+    tiles = lap[:rows * tile_size, :cols * tile_size].reshape(rows, tile_size, cols, tile_size)
+
+    return tiles.var(axis=(1, 3))
+
+
+def heatmap(gray, tile_scores, tile_size=TILE_SIZE):
+    """
+    Tints an image by the sharpness of its tiles: the sharpest tile is green and the blurriest red. Colors are relative
+    to the image itself, so they show which parts are out of focus rather than how blurry the image is overall
+
+    :param gray: The grayscale image the tile scores were computed from
+    :param tile_scores: The result of tile_sharpness
+    :return: A PIL image the same size as gray
+    """
+    levels = np.log1p(tile_scores)  # Variances span several orders of magnitude
+    levels = (levels - levels.min()) / max(levels.max() - levels.min(), 1e-6)
+
+    tile_size = min(tile_size, gray.shape[0] - 2, gray.shape[1] - 2)
+    grid = np.repeat(np.repeat(levels, tile_size, axis=0), tile_size, axis=1)
+    grid = np.pad(grid, ((0, gray.shape[0] - grid.shape[0]), (0, gray.shape[1] - grid.shape[1])), mode="edge")
+
+    colors = np.stack([255 * (1 - grid), 255 * grid, np.zeros_like(grid)], axis=2)
+    tinted = 0.5 * gray[..., np.newaxis] + 0.5 * colors
+
+    return Image.fromarray(tinted.astype(np.uint8))
+
+
+def detect_blur(label, path, tile_size=TILE_SIZE, max_size=SCORE_SIZE, cancel_token=None, progress=None):
+    """
+    Scores the sharpness of an image and creates its sharpness heatmap; meant to be run by a Worker
+
+    :return: (heatmap image, sharpness) and label
+    """
+    gray = load_pixels(path, "L", max_size)
+    if cancel_token is not None:
+        cancel_token.check()
+
+    return (heatmap(gray, tile_sharpness(gray, tile_size), tile_size), sharpness(gray)), label
+
+
+def score_files(paths, max_size=SCORE_SIZE):
+    """Returns (path, sharpness) for every image in paths; the sharpness is None for files that can't be read"""
+    scores = []
+
+    for path in paths:
+        try:
+            scores.append((path, sharpness(load_pixels(path, "L", max_size))))
+        # OSError includes PIL.UnidentifiedImageError; ValueError covers images too small to score, and oversized
+        # images raise DecompressionBombError, which isn't an OSError
+        except (OSError, ValueError, Image.DecompressionBombError):
+            scores.append((path, None))
+
+    return scores
+
+
+def find_images(directory):
+    """Returns the paths of every supported image file in a directory and its subdirectories, sorted by path"""
+    paths = []
+
+    for root, _, names in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in names if name.lower().endswith(tuple(PIL_FORMATS)))
+
+    return sorted(paths)
+
+
+def write_ranking(csv_path, scores):
+    """
+    Writes sharpness scores to a CSV file, blurriest image first; unreadable files are listed last without a rank
+
+    :param scores: A list of (path, sharpness) as returned by score_files
+    """
+    readable = sorted((score for score in scores if score[1] is not None), key=lambda score: score[1])
+    unreadable = [score for score in scores if score[1] is None]
+
+    temp_name = temp_file_for(csv_path)
+    try:
+        with open(temp_name, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+
+            for rank, (path, score) in enumerate(readable, 1):
+                writer.writerow([rank, "{:.2f}".format(score), path])
+            for path, _ in unreadable:
+                writer.writerow(["", "", path])
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+    replace_file(temp_name, csv_path)
+
+
+def scan_directory(label, directory, csv_path, max_size=SCORE_SIZE, max_workers=None, cancel_token=None,
+                   progress=None):
+    """
+    Scores every image in a directory and its subdirectories and writes them to a CSV file ranked from blurriest to
+    sharpest; meant to be run by a Worker
+
+    Images are decoded and scored on a pool of processes, BATCH_SIZE files per task, and only file names and scores
+    are sent between processes
+
+    :param label: A QLabel passed back along with the scores
+    :param max_workers: The number of processes used; defaults to the number of CPUs
+    :return: A list of (path, sharpness) for every image found, and label
+    """
+    paths = find_images(directory)
+    batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    scores = []
+
+    # Spawned rather than forked, since the GUI runs this on a thread of a process that's running Qt
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(score_files, batch, max_size) for batch in batches]
+
+        try:
+            for future in as_completed(futures):
+                scores.extend(future.result())
+
+                if cancel_token is not None:
+                    cancel_token.check()
+                if progress is not None:
+                    progress("Scanned " + str(len(scores)) + " of " + str(len(paths)) + " images")
+        except BaseException:
+            for future in futures:
+                future.cancel()  # Batches that haven't been started yet are skipped
+            raise
+
+    write_ranking(csv_path, scores)
+
+    return scores, label
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Rank the images in a directory from blurriest to sharpest")
+    parser.add_argument("directory", help="directory to scan, including its subdirectories")
+    parser.add_argument("-o", "--output", default="blur_ranking.csv", help="CSV file to write the ranking to")
+    parser.add_argument("-s", "--size", type=int, default=SCORE_SIZE,
+                        help="size images are decoded at before scoring (default: %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    results, _ = scan_directory(None, args.directory, args.output, args.size, args.workers)
+    t1 = time.perf_counter()
+
+    print("Scored {} images in {:.1f} seconds ({:.0f} images per minute)".format(
+        len(results), t1 - t0, 60 * len(results) / max(t1 - t0, 1e-9)))
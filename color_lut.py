@@ -0,0 +1,262 @@
+import os
+import numpy as np
+from PIL import Image
+from colour import Color
+from functools import lru_cache
+from image_loading import load_pixels
+
+LUT_SIZE = 33  # Number of lattice points along each axis of procedurally generated LUTs; the usual .cube size
+TILE_PIXELS = 1 << 16  # Roughly how many pixels are warped at once; bounds memory use and keeps the work in cache
+
+
+class ColorLUT:
+    """A 3D lookup table mapping every RGB color to a new one. Colors between lattice points are found by trilinear
+    interpolation of the eight surrounding points, or by taking the nearest point if interpolate is False"""
+
+    def __init__(self, table, domain_min=(0.0, 0.0, 0.0), domain_max=(1.0, 1.0, 1.0), interpolate=True):
+        """
+        :param table: A (size, size, size, 3) numpy array indexed [red, green, blue] holding new colors from 0 to 1
+        :param domain_min: The input color, from 0 to 1, of the first lattice point along each axis
+        :param domain_max: The input color of the last lattice point along each axis
+        :param interpolate: Blend the surrounding lattice points; turn off for LUTs that must only output the colors
+        in their table, such as palettes
+        """
+        n = table.shape[0]
+        if n < 2 or table.shape != (n, n, n, 3):
+            raise ValueError("A 3D LUT needs at least 2 lattice points along each axis")
+
+        self.size = n
+        self.interpolate = interpolate
+        # One row per channel, so every step below works on contiguous arrays
+        self.table = np.ascontiguousarray(np.asarray(table, dtype=np.float32).reshape(-1, 3).T)
+
+        # Input values are 8-bit, so everything that depends on a single channel value is computed once for all 256
+        # values: the offset into the flattened table of the lattice point below it, and how far past that point it is
+        values = np.arange(256, dtype=np.float32)[:, np.newaxis]
+        domain_min = np.asarray(domain_min, dtype=np.float32)
+        domain_max = np.asarray(domain_max, dtype=np.float32)
+        if np.any(domain_max <= domain_min):
+            raise ValueError("The upper end of a LUT's input domain must be larger than the lower end on every channel")
+
+        coords = np.clip((values / 255 - domain_min) / (domain_max - domain_min) * (n - 1), 0, n - 1)
+
+        if interpolate:
+            lower = np.minimum(coords.astype(np.intp), n - 2)  # The last cell also holds the upper edge
+        else:
+            lower = np.rint(coords).astype(np.intp)
+
+        offsets = lower * np.array([n * n, n, 1])
+        fractions = (coords - lower).astype(np.float32)
+
+        self.offsets = [np.ascontiguousarray(offsets[:, i]) for i in range(3)]
+        self.fractions = [np.ascontiguousarray(fractions[:, i]) for i in range(3)]
+
+    def apply(self, pixels):
+        """
+        Warps the colors of an (n, 3) numpy array of 8-bit RGB values
+
+        :return: A new (n, 3) numpy array of 8-bit RGB values
+        """
+        n = self.size
+        red, green, blue = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+
+        base = np.take(self.offsets[0], red)  # Index of the lattice point below each color
+        base += np.take(self.offsets[1], green)
+        base += np.take(self.offsets[2], blue)
+
+        if not self.interpolate:
+            colors = np.take(self.table, base, axis=1)
+        else:
+            fr, fg, fb = (np.take(fractions, channel) for fractions, channel in zip(self.fractions, pixels.T))
+
+            # Interpolate along blue, then green, then red
+            c00 = self.lerp(base, 1, fb)
+            c01 = self.lerp(base + n, 1, fb)
+            c10 = self.lerp(base + n * n, 1, fb)
+            c11 = self.lerp(base + n * n + n, 1, fb)
+
+            c01 -= c00
+            c01 *= fg
+            c00 += c01
+
+            c11 -= c10
+            c11 *= fg
+            c10 += c11
+
+            c10 -= c00
+            c10 *= fr
+            c00 += c10
+            colors = c00
+
+        colors *= 255
+        colors += 0.5  # Round rather than truncate
+        np.clip(colors, 0, 255, out=colors)
+
+        return colors.T.astype(np.uint8)
+
+    def lerp(self, indices, step, fractions):
+        """Blends the lattice points at indices with the ones step further along the flattened table"""
+        start = np.take(self.table, indices, axis=1)
+        end = np.take(self.table, indices + step, axis=1)
+
+        end -= start
+        end *= fractions
+        start += end
+
+        return start
+
+
+def lattice(size=LUT_SIZE):
+    """Returns the identity table: a (size, size, size, 3) numpy array where every lattice point holds its own color"""
+    steps = np.linspace(0, 1, size, dtype=np.float32)
+
+    return np.stack(np.meshgrid(steps, steps, steps, indexing="ij"), axis=3)
+
+
+@lru_cache(maxsize=8)
+def read_cube(path, modified_time):
+    """Parses a .cube file; modified_time is only part of the cache key, so an edited file is read again"""
+    size = None
+    domain_min, domain_max = (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)
+    values = []
+
+    with open(path) as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if line == "":
+                continue
+
+            keyword = line.split()[0]
+            if keyword == "LUT_3D_SIZE":
+                size = int(line.split()[1])
+            elif keyword == "LUT_1D_SIZE":
+                raise ValueError("1D LUTs are not supported; please use a 3D LUT")
+            elif keyword == "DOMAIN_MIN":
+                domain_min = tuple(float(value) for value in line.split()[1:4])
+            elif keyword == "DOMAIN_MAX":
+                domain_max = tuple(float(value) for value in line.split()[1:4])
+            elif keyword == "LUT_3D_INPUT_RANGE":  # Written by DaVinci Resolve; the same domain for every channel
+                low, high = (float(value) for value in line.split()[1:3])
+                domain_min, domain_max = (low, low, low), (high, high, high)
+            elif keyword[0].isdigit() or keyword[0] in "-.":
+                values.append(line)
+            # Any other keyword (TITLE, ...) doesn't affect the colors
+
+    if size is None:
+        raise ValueError("The .cube file has no LUT_3D_SIZE line")
+
+    table = np.fromstring(" ".join(values), dtype=np.float32, sep=" ")
+    if len(table) != size ** 3 * 3:
+        raise ValueError("The .cube file should have " + str(size ** 3) + " colors but has " + str(len(table) // 3))
+
+    # Red changes fastest in .cube files, so the rows are in [blue, green, red] order
+    table = table.reshape(size, size, size, 3).transpose(2, 1, 0, 3)
+
+    return ColorLUT(table, domain_min, domain_max)
+
+
+def load_cube(path):
+    """Loads a 3D LUT from a .cube file, reusing the parsed LUT if the file hasn't changed since it was last loaded"""
+    return read_cube(os.path.abspath(path), os.path.getmtime(path))
+
+
+@lru_cache(maxsize=16)
+def hue_rotation_lut(degrees, size=LUT_SIZE):
+    """Creates a LUT that rotates every hue by degrees around the gray axis, keeping grays the same"""
+    angle = np.radians(degrees)
+    cos, sin = np.cos(angle), np.sin(angle)
+    third, root = 1 / 3, np.sqrt(1 / 3)
+
+    # Rotation about the (1, 1, 1) axis
+    matrix = np.array([
+        [cos + third * (1 - cos), third * (1 - cos) - root * sin, third * (1 - cos) + root * sin],
+        [third * (1 - cos) + root * sin, cos + third * (1 - cos), third * (1 - cos) - root * sin],
+        [third * (1 - cos) - root * sin, third * (1 - cos) + root * sin, cos + third * (1 - cos)]
+    ], dtype=np.float32)
+
+    return ColorLUT(np.clip(lattice(size) @ matrix.T, 0, 1))
+
+
+@lru_cache(maxsize=8)
+def channel_swap_lut(order, size=LUT_SIZE):
+    """Creates a LUT that reorders the color channels; order is e.g. "BGR" to swap red and blue"""
+    if sorted(order) != ["B", "G", "R"]:
+        raise ValueError("The channel order must use each of R, G and B once")
+
+    return ColorLUT(lattice(size)[..., ["RGB".index(channel) for channel in order]])
+
+
+def parse_palette(text):
+    """Turns a comma-separated list of color names or hex codes into a tuple of 8-bit RGB tuples"""
+    names = [name.strip() for name in text.split(",") if name.strip() != ""]
+    if len(names) == 0:
+        raise ValueError("Please enter at least one color")
+
+    # Color raises ValueError for names it doesn't know
+    return tuple(tuple(int(round(value * 255)) for value in Color(name).rgb) for name in names)
+
+
+@lru_cache(maxsize=8)
+def palette_lut(palette, size=LUT_SIZE):
+    """Creates a LUT that replaces every color with the closest color in palette, a tuple of 8-bit RGB tuples"""
+    colors = lattice(size).reshape(-1, 3)
+    palette = np.array(palette, dtype=np.float32) / 255
+
+    distances = (colors ** 2).sum(axis=1)[:, np.newaxis] - 2 * colors @ palette.T + (palette ** 2).sum(axis=1)
+    table = palette[np.argmin(distances, axis=1)]
+
+    return ColorLUT(table.reshape(size, size, size, 3), interpolate=False)
+
+
+def create_lut(mode, setting):
+    """
+    Creates one of the LUTs offered in the GUI
+
+    :param mode: One of "Rotate hues", "Swap channels", "Palette" or ".cube file"
+    :param setting: The angle in degrees, channel order, comma-separated colors or .cube path respectively
+    """
+    if mode == "Rotate hues":
+        return hue_rotation_lut(float(setting))
+    elif mode == "Swap channels":
+        return channel_swap_lut(setting)
+    elif mode == "Palette":
+        return palette_lut(parse_palette(setting))
+    elif mode == ".cube file":
+        return load_cube(setting)
+    else:
+        raise ValueError("Unknown warp mode: " + mode)
+
+
+def apply_lut(img_data, lut, cancel_token=None, progress=None):
+    """
+    Warps the colors of an image a tile of rows at a time, so only about TILE_PIXELS pixels of intermediate values are
+    in memory at once however large the image is
+
+    :param img_data: A (height, width, 3) numpy array of 8-bit RGB values
+    :return: A new numpy array of the same shape
+    """
+    height, width = img_data.shape[0], img_data.shape[1]
+    rows = max(1, TILE_PIXELS // max(width, 1))
+    new_data = np.empty((height, width, 3), dtype=np.uint8)
+
+    for row in range(0, height, rows):
+        if cancel_token is not None:
+            cancel_token.check()
+
+        tile = img_data[row:row + rows]
+        new_data[row:row + rows] = lut.apply(tile.reshape(-1, 3)).reshape(tile.shape)
+
+        if progress is not None:
+            progress("Warping colors... " + str((100 * min(row + rows, height)) // height) + "%")
+
+    return new_data
+
+
+def warp_colors(label, path, mode, setting, max_size=None, cancel_token=None, progress=None):
+    """Warps the colors of an image with one of the LUTs from create_lut; meant to be run by a Worker
+    path is an image file or an already loaded numpy array (see load_pixels)
+    If max_size is given, the image is shrunk to fit within max_size by max_size pixels"""
+    lut = create_lut(mode, setting)
+    img_data = load_pixels(path, "RGB", max_size)
+
+    return Image.fromarray(apply_lut(img_data, lut, cancel_token, progress)), label
@@ -0,0 +1,257 @@
+import os
+import shutil
+import tempfile
+from collections import Counter
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from image_saving import save_image, temp_file_for, replace_file, DEFAULT_PROFILE
+import netpbm
+
+MAX_WORKERS = 8  # Upper bound on the number of files converted at the same time
+
+# For each of the formats in SUPPORTED_FORMATS (see image_art_creator), the extension of the new file and the
+# fastest backend able to write it. Pillow and netpbm convert in-process; Wand starts ImageMagick, so it's only
+# used as a fallback
+FORMAT_SPECS = {
+    ".png": (".png", "pillow"),
+    ".jpg": (".jpg", "pillow"),
+    ".ppm (P6; compressed)": (".ppm", "pillow"),
+    ".ppm (P3; uncompressed)": (".ppm", "netpbm"),
+    ".bmp": (".bmp", "pillow"),
+    ".pgm": (".pgm", "pillow")
+}
+
+# ImageMagick compression quality for each profile, by file format
+# For PNG, the tens digit is the zlib compression level and the ones digit the PNG filter (5 = adaptive)
+WAND_PROFILES = {
+    "Fast": {".png": 10, ".jpg": 90},
+    "Small": {".png": 95, ".jpg": 80}
+}
+
+
+def new_extension_for(new_format):
+    """Returns the file extension of one of the formats in FORMAT_SPECS, e.g. ".ppm" for ".ppm (P3; uncompressed)\""""
+    return FORMAT_SPECS[new_format][0]
+
+
+def convert_with_pillow(path, new_file_name, new_format, profile=DEFAULT_PROFILE, cancel_token=None):
+    """Converts an image using Pillow; raises UnidentifiedImageError if Pillow can't read the original image"""
+    with Image.open(path) as img:
+        save_image(None, img, new_file_name, profile, cancel_token)
+
+
+def convert_with_netpbm(path, new_file_name, new_format, profile=DEFAULT_PROFILE, cancel_token=None):
+    """Writes an uncompressed (P3) PPM file. PPM/PGM originals are streamed a strip at a time; other images are
+    decoded with Pillow first"""
+    header = netpbm.open_header(path)
+
+    if header is not None:
+        width, height = header.width, header.height
+        strips = (netpbm.to_rgb(netpbm.to_8bit(strip, header.maxval)) for _, strip in netpbm.iter_strips(path))
+    else:
+        with Image.open(path) as img:
+            pixels = np.asarray(img.convert("RGB"))
+
+        height, width = pixels.shape[0], pixels.shape[1]
+        strips = (pixels[row:row + netpbm.STRIP_HEIGHT] for row in range(0, height, netpbm.STRIP_HEIGHT))
+
+    temp_name = temp_file_for(new_file_name)
+    try:
+        netpbm.write_netpbm_strips(temp_name, width, height, 3, strips, plain=True)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+    replace_file(temp_name, new_file_name, cancel_token)
+
+
+def convert_with_wand(path, new_file_name, new_format, profile=DEFAULT_PROFILE, cancel_token=None):
+    """Converts an image using Wand (ImageMagick), which also supports uncompressed formats"""
+    from wand.image import Image as ImageWand  # Loading ImageMagick is slow, so only do it when it's needed
+
+    with ImageWand(filename=path) as img:
+        if new_format == ".ppm (P3; uncompressed)":
+            img.format = "ppm"
+            img.compression = "no"
+        else:
+            img.format = new_extension_for(new_format)[1:]
+
+        quality = WAND_PROFILES[profile].get(new_format)
+        if quality is not None:
+            img.compression_quality = quality
+
+        temp_name = temp_file_for(new_file_name)
+        try:
+            img.save(filename=temp_name)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+    replace_file(temp_name, new_file_name, cancel_token)
+
+
+BACKENDS = {
+    "pillow": convert_with_pillow,
+    "netpbm": convert_with_netpbm,
+    "wand": convert_with_wand
+}
+
+
+def convert_file(path, new_file_name, new_format, profile=DEFAULT_PROFILE, cancel_token=None):
+    """
+    Converts a single image with the fastest backend for new_format; if Pillow can't read the original image,
+    Wand is used instead. Errors while writing the new file are raised as they are
+
+    :param path: Path of the original image
+    :param new_file_name: Where to save the copy; must already end with the new extension
+    :param new_format: One of the keys of FORMAT_SPECS
+    :param profile: One of the encoder profiles in image_saving
+    :param cancel_token: Optional CancelToken; checked before the conversion starts, and a cancelled conversion never
+    replaces new_file_name
+    """
+    if cancel_token is not None:
+        cancel_token.check()
+
+    backend = FORMAT_SPECS[new_format][1]
+
+    if backend != "wand":
+        try:
+            BACKENDS[backend](path, new_file_name, new_format, profile, cancel_token)
+            return
+        except UnidentifiedImageError:  # Only raised by Image.open, when Pillow doesn't recognize the file
+            pass
+
+    convert_with_wand(path, new_file_name, new_format, profile, cancel_token)
+
+
+def convert_image(label, path, new_file_name, new_format, profile=DEFAULT_PROFILE, cancel_token=None,
+                  progress=None):
+    """
+    Creates a copy of an image in a different file format; meant to be run by a Worker
+
+    :param label: A QLabel passed back along with the new file name
+    :return: new_file_name and label
+    """
+    if progress is not None:
+        progress("Converting file...")
+
+    convert_file(path, new_file_name, new_format, profile, cancel_token)
+
+    return new_file_name, label
+
+
+def new_file_names_for(paths, new_directory, extension):
+    """
+    Names the copies of a batch of images: each copy keeps the name of its original with the new extension, unless
+    that would give two copies the same name. Then the old extension is kept in the name (a.png and a.bmp become
+    a_png.jpg and a_bmp.jpg), and a number is added if the names still clash. Names are compared ignoring case, since
+    many file systems do
+
+    :return: A list of paths in new_directory, in the same order as paths
+    """
+    names = [os.path.splitext(os.path.basename(path)) for path in paths]
+    counts = Counter(name.lower() for name, _ in names)
+    taken = set()
+    new_file_names = []
+
+    for name, old_extension in names:
+        if counts[name.lower()] > 1:
+            name += "_" + old_extension.lstrip(".")
+
+        new_name = name
+        number = 2
+        while new_name.lower() in taken:
+            new_name = name + "_" + str(number)
+            number += 1
+
+        taken.add(new_name.lower())
+        new_file_names.append(os.path.join(new_directory, new_name + extension))
+
+    return new_file_names
+
+
+def convert_files(label, paths, new_directory, new_format, profile=DEFAULT_PROFILE, max_workers=None,
+                  cancel_token=None, progress=None):
+    """
+    Converts many images at once; meant to be run by a Worker
+
+    Both Pillow and ImageMagick release the GIL while decoding and encoding, so files are converted on a
+    bounded pool of threads
+
+    :param label: A QLabel passed back along with the new file names
+    :param paths: Paths of the original images
+    :param new_directory: The directory the copies are saved to; they keep their original names apart from
+    the extension (see new_file_names_for)
+    :param new_format: One of the keys of FORMAT_SPECS
+    :param max_workers: How many files to convert at the same time; defaults to the number of CPUs, up to MAX_WORKERS
+    :return: The list of new file names and label
+    """
+    if max_workers is None:
+        max_workers = min(MAX_WORKERS, os.cpu_count() or 1)
+
+    new_file_names = new_file_names_for(paths, new_directory, new_extension_for(new_format))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(convert_file, path, new_file_name, new_format, profile, cancel_token)
+                   for path, new_file_name in zip(paths, new_file_names)]
+
+        try:
+            for num_done, future in enumerate(as_completed(futures), 1):
+                future.result()  # Raises the exception of a failed conversion
+
+                if cancel_token is not None:
+                    cancel_token.check()
+                if progress is not None:
+                    progress("Converted " + str(num_done) + " of " + str(len(paths)) + " files")
+        except BaseException:
+            for future in futures:
+                future.cancel()  # Files that haven't been started yet are skipped
+            raise
+
+    return new_file_names, label
+
+
+def benchmark(path, repeats=3):
+    """
+    Times every backend that can write each of the supported formats, converting the image at path
+
+    :return: A dictionary mapping (format, backend) to the best time in seconds out of repeats conversions
+    """
+    import time
+
+    timings = {}
+    directory = tempfile.mkdtemp()
+
+    try:
+        for new_format in FORMAT_SPECS:
+            new_file_name = os.path.join(directory, "benchmark" + new_extension_for(new_format))
+            backends = [FORMAT_SPECS[new_format][1], "wand"]
+
+            for backend in backends:
+                best = None
+                for _ in range(repeats):
+                    t0 = time.perf_counter()
+                    try:
+                        BACKENDS[backend](path, new_file_name, new_format)
+                    except (OSError, ImportError) as err:  # ImageMagick isn't installed, or the file can't be read
+                        print("Skipping", new_format, "with", backend + ":", err)
+                        break
+                    t1 = time.perf_counter()
+
+                    if best is None or t1 - t0 < best:
+                        best = t1 - t0
+
+                if best is not None:
+                    timings[(new_format, backend)] = best
+    finally:
+        shutil.rmtree(directory)
+
+    return timings
+
+
+if __name__ == "__main__":
+    import sys
+
+    for (new_format, backend), seconds in benchmark(sys.argv[1]).items():
+        print("{:<26}{:<8}{:.3f} seconds".format(new_format, backend, seconds))
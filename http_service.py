@@ -0,0 +1,450 @@
+# Headless HTTP service for the ASCII art, Group colors and format conversion tools
+# Run with "python http_service.py --port 8000". Every tool is a POST endpoint that takes the raw image file as the
+# request body and its options as query parameters:
+#
+#     POST /ascii?start_color=red&end_color=blue&bgcolor=white
+#     POST /kmeans?k=5
+#     POST /convert?format=png   (png, jpg, ppm-p6, ppm-p3, bmp or pgm)
+#
+# Add mode=async to get a job id right away instead of waiting for the image, then poll GET /jobs/<id> and download
+# the image from GET /jobs/<id>/result. GET /health reports the queue depth, latency percentiles and throughput.
+# When the queue is full, requests are rejected with 429 Too Many Requests
+
+import io
+import json
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from colour import Color
+
+QUEUE_SIZE = 32  # Jobs waiting for a worker; further requests get 429 Too Many Requests
+MAX_UPLOAD = 64 * 1024 * 1024  # Largest request body accepted, in bytes
+READ_SIZE = 64 * 1024  # Uploads are streamed to disk this many bytes at a time
+SYNC_TIMEOUT = 60  # Seconds a synchronous request waits before it's turned into an asynchronous one
+RESULT_TTL = 600  # Seconds a finished job's result is kept for polling clients
+MAX_RESULTS = 64  # Most finished results kept at once; the oldest are dropped first, even before RESULT_TTL
+RETRY_AFTER = 2  # Seconds clients are told to wait after a 429
+LATENCY_WINDOW = 1000  # Number of recent jobs used for the latency percentiles
+THROUGHPUT_WINDOW = 60  # Seconds over which throughput is measured
+
+# Values of the format query parameter of /convert, mapped to SUPPORTED_FORMATS in image_art_creator
+CONVERT_FORMATS = {
+    "png": ".png",
+    "jpg": ".jpg",
+    "ppm-p6": ".ppm (P6; compressed)",
+    "ppm-p3": ".ppm (P3; uncompressed)",
+    "bmp": ".bmp",
+    "pgm": ".pgm"
+}
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".bmp": "image/bmp",
+    ".ppm": "image/x-portable-pixmap",
+    ".pgm": "image/x-portable-graymap"
+}
+
+
+def encode_png(img):
+    """Returns a PIL image as PNG bytes"""
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG", compress_level=1)
+
+    return buffer.getvalue()
+
+
+def run_job(tool, path, params):
+    """
+    Runs one of the tools on an uploaded file; runs in a worker process
+
+    :param tool: "ascii", "kmeans" or "convert"
+    :param path: Path of the uploaded image
+    :param params: The query parameters of the request, as a dictionary of strings
+    :return: The resulting file as bytes, along with its content type
+    """
+    if tool == "ascii":
+        from ascii_art import ascii_art
+
+        img, _ = ascii_art(None, path, params.get("start_color", ""), params.get("end_color", ""),
+                           params.get("bgcolor", ""))
+        return encode_png(img), CONTENT_TYPES[".png"]
+
+    elif tool == "kmeans":
+        from k_means_image import k_means
+
+        img, _ = k_means(None, path, int(params.get("k", "5")))
+        return encode_png(img), CONTENT_TYPES[".png"]
+
+    else:
+        from format_conversion import convert_file, new_extension_for
+
+        new_format = CONVERT_FORMATS[params.get("format", "png")]
+        extension = new_extension_for(new_format)
+        new_file_name = os.path.splitext(path)[0] + "-converted" + extension
+
+        try:
+            convert_file(path, new_file_name, new_format)
+            with open(new_file_name, "rb") as f:
+                return f.read(), CONTENT_TYPES[extension]
+        finally:
+            if os.path.exists(new_file_name):
+                os.remove(new_file_name)
+
+
+def parse_content_length(value):
+    """Returns the value of a Content-Length header as an int; raises ValueError unless it's a non-negative integer"""
+    value = value.strip()
+    if not (value.isascii() and value.isdigit()):  # Rejects signs, spaces and non-ASCII digits that int() accepts
+        raise ValueError("Content-Length must be a non-negative integer")
+
+    return int(value)
+
+
+def check_params(tool, params):
+    """Raises ValueError if a request's query parameters are invalid, before the upload is read"""
+    if tool == "ascii":
+        for name in ("start_color", "end_color", "bgcolor"):
+            value = params.get(name, "")
+            if value == "":  # Blank colors fall back to black and white
+                continue
+
+            try:
+                Color(value)
+            except (ValueError, AttributeError):  # colour raises AttributeError for malformed hex codes
+                raise ValueError(name + " is not a recognized color: " + value)
+    if tool == "kmeans" and not 2 <= int(params.get("k", "5")) <= 10:
+        raise ValueError("k must be between 2 and 10")
+    if tool == "convert" and params.get("format", "png") not in CONVERT_FORMATS:
+        raise ValueError("format must be one of " + ", ".join(CONVERT_FORMATS))
+
+
+class Job:
+    """A single request waiting in, or taken from, the JobQueue"""
+    def __init__(self, tool, path, params):
+        self.id = uuid.uuid4().hex
+        self.tool = tool
+        self.path = path  # Temporary file holding the upload
+        self.params = params
+
+        self.status = "queued"  # Then "running", and finally "done" or "error"
+        self.result = None
+        self.content_type = None
+        self.error = None
+
+        self.created = time.monotonic()
+        self.finished = None
+        self.done = threading.Event()
+
+    def describe(self, position=None):
+        """Returns the job's status as a dictionary, for JSON responses"""
+        description = {"id": self.id, "status": self.status}
+        if position is not None:
+            description["queue_position"] = position
+        if self.error is not None:
+            description["error"] = self.error
+
+        return description
+
+
+class JobQueue:
+    """A bounded queue of jobs and the workers running them
+
+    Each worker thread takes the oldest job and runs it in a process pool, so jobs don't compete for the GIL"""
+
+    def __init__(self, num_workers, queue_size=QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Spawned rather than forked: the pool starts its processes on the first job, when the server and worker
+        # threads are already running
+        self.executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.lock = threading.Lock()
+
+        self.jobs = {}  # Job id -> Job, for every job that hasn't expired yet
+        self.waiting = deque()  # Ids of queued jobs, oldest first; used to report queue positions
+        self.running = 0
+
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # Seconds from upload to result of recent jobs
+        self.finish_times = deque()  # When each job in the last THROUGHPUT_WINDOW seconds finished
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+        for _ in range(num_workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def is_full(self):
+        return self.queue.full()
+
+    def reject(self):
+        """Counts a request turned away because the queue was full"""
+        with self.lock:
+            self.rejected += 1
+
+    def submit(self, job):
+        """Adds a job to the queue; raises queue.Full if there's no room"""
+        self.expire()
+        with self.lock:
+            self.queue.put_nowait(job)
+            self.jobs[job.id] = job
+            self.waiting.append(job.id)
+
+    def position(self, job):
+        """Returns the 1-based position of a queued job, or None once a worker has taken it"""
+        with self.lock:
+            try:
+                return self.waiting.index(job.id) + 1
+            except ValueError:
+                return None
+
+    def get(self, job_id):
+        self.expire()
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def remove(self, job_id):
+        """Forgets a finished job once its result has been downloaded"""
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def expire(self):
+        """Forgets finished jobs whose results were never downloaded, once they're older than RESULT_TTL or once there
+        are more than MAX_RESULTS of them; called whenever a job is submitted or finishes, so memory stays bounded
+        even if nobody polls"""
+        now = time.monotonic()
+
+        with self.lock:
+            finished = sorted((job for job in self.jobs.values() if job.finished is not None),
+                              key=lambda job: job.finished)
+
+            for i, job in enumerate(finished):
+                if now - job.finished > RESULT_TTL or i < len(finished) - MAX_RESULTS:
+                    del self.jobs[job.id]
+
+    def work(self):
+        """Worker thread: runs jobs until the program exits"""
+        while True:
+            job = self.queue.get()
+
+            with self.lock:
+                self.waiting.remove(job.id)
+                self.running += 1
+            job.status = "running"
+
+            try:
+                job.result, job.content_type = self.executor.submit(run_job, job.tool, job.path, job.params).result()
+                job.status = "done"
+            except Exception as err:
+                job.error = type(err).__name__ + ": " + str(err)
+                job.status = "error"
+            finally:
+                os.remove(job.path)
+
+            job.finished = time.monotonic()
+
+            with self.lock:
+                self.running -= 1
+                if job.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+                self.latencies.append(job.finished - job.created)
+                self.finish_times.append(job.finished)
+
+            job.done.set()
+            self.expire()
+
+    def metrics(self):
+        """Returns the queue's health metrics as a dictionary"""
+        now = time.monotonic()
+
+        with self.lock:
+            while self.finish_times and now - self.finish_times[0] > THROUGHPUT_WINDOW:
+                self.finish_times.popleft()
+
+            latencies = sorted(self.latencies)
+            metrics = {
+                "queue_depth": len(self.waiting),
+                "queue_size": self.queue.maxsize,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "throughput_per_second": len(self.finish_times) / THROUGHPUT_WINDOW
+            }
+
+        for percentile in (50, 95, 99):
+            if latencies:
+                index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+                metrics["latency_p" + str(percentile)] = latencies[index]
+            else:
+                metrics["latency_p" + str(percentile)] = None
+
+        return metrics
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Handles a single HTTP request; self.server.jobs is the JobQueue"""
+    tools = {"/ascii": "ascii", "/kmeans": "kmeans", "/convert": "convert"}
+
+    def send_json(self, code, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def send_result(self, job):
+        self.send_response(200)
+        self.send_header("Content-Type", job.content_type)
+        self.send_header("Content-Length", str(len(job.result)))
+        self.end_headers()
+
+        self.wfile.write(job.result)
+
+    def read_upload(self, length):
+        """Streams the length-byte request body to a temporary file and returns its path"""
+        fd, path = tempfile.mkstemp(prefix="upload-")
+
+        with os.fdopen(fd, "wb") as f:
+            remaining = length
+            while remaining > 0:
+                chunk = self.rfile.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        if remaining > 0:
+            os.remove(path)
+            raise ValueError("Upload ended early")
+
+        return path
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        tool = self.tools.get(url.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        jobs = self.server.jobs
+
+        if tool is None:
+            self.send_json(404, {"error": "Unknown endpoint"})
+            return
+
+        if self.headers["Content-Length"] is None:
+            self.send_json(411, {"error": "Content-Length is required"})
+            return
+
+        try:
+            length = parse_content_length(self.headers["Content-Length"])
+            check_params(tool, params)
+        except ValueError as err:
+            self.close_connection = True  # The body wasn't read, so the connection can't be reused
+            self.send_json(400, {"error": str(err)})
+            return
+
+        if length > MAX_UPLOAD:
+            self.close_connection = True
+            self.send_json(413, {"error": "Upload is larger than " + str(MAX_UPLOAD) + " bytes"})
+            return
+
+        # Turn requests away before reading their upload when there's no room for them
+        if jobs.is_full():
+            jobs.reject()
+            self.close_connection = True
+            self.send_json(429, {"error": "Too many jobs", "queue_depth": jobs.queue.maxsize},
+                           {"Retry-After": str(RETRY_AFTER)})
+            return
+
+        try:
+            job = Job(tool, self.read_upload(length), params)
+        except ValueError as err:
+            self.send_json(400, {"error": str(err)})
+            return
+
+        try:
+            jobs.submit(job)
+        except queue.Full:  # Another request took the last spot while this upload was being read
+            os.remove(job.path)
+            jobs.reject()
+            self.send_json(429, {"error": "Too many jobs", "queue_depth": jobs.queue.maxsize},
+                           {"Retry-After": str(RETRY_AFTER)})
+            return
+
+        if params.get("mode") != "async" and job.done.wait(SYNC_TIMEOUT):
+            self.finish_job(job)
+        else:
+            self.send_json(202, job.describe(jobs.position(job)), {"Location": "/jobs/" + job.id})
+
+    def finish_job(self, job):
+        """Sends a finished job's result, or its error, and forgets the job"""
+        if job.status == "done":
+            self.send_result(job)
+        else:
+            self.send_json(500, job.describe())
+
+        self.server.jobs.remove(job.id)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        jobs = self.server.jobs
+
+        if parts == ["health"]:
+            self.send_json(200, jobs.metrics())
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            job = jobs.get(parts[1])
+
+            if job is None:
+                self.send_json(404, {"error": "Unknown or expired job"})
+            elif len(parts) == 2:
+                self.send_json(200, job.describe(jobs.position(job)))
+            elif parts[2] != "result":
+                self.send_json(404, {"error": "Unknown endpoint"})
+            elif not job.done.is_set():
+                self.send_json(409, job.describe(jobs.position(job)))
+            else:
+                self.finish_job(job)
+        else:
+            self.send_json(404, {"error": "Unknown endpoint"})
+
+
+def serve(host="127.0.0.1", port=8000, num_workers=None, queue_size=QUEUE_SIZE):
+    """Starts the service and handles requests until interrupted"""
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.jobs = JobQueue(num_workers or os.cpu_count() or 1, queue_size)
+
+    print("Serving on http://{}:{}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.jobs.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the image tools as a local HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="number of jobs run at once (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="number of jobs that can wait in line")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.queue_size)
@@ -1,3 +1,6 @@
+import time
+STARTUP_TIME = time.perf_counter()  # Used by the --startup-times option
+
 import fix_qt_import_error
 
 from PyQt5.QtWidgets import *
@@ -6,14 +9,27 @@ from PyQt5.QtGui import *
 from PyQt5 import QtCore
 
 from notice_dialog import NoticeDialog
-from multithreading import Worker
+from multithreading import Worker, ProcessWorker, shutdown_process_pool
+from image_saving import save_image, ENCODER_PROFILES, DEFAULT_PROFILE
+from multiprocessing import freeze_support
+import importlib
+import sys
 
-from ascii_art import ascii_art
-from k_means_image import k_means
+# Modules that take a while to import (NumPy, PIL, colour, ...) are imported with load_module the first time they're
+# needed instead of at startup, so the window appears sooner. These are the ones timed by --startup-times
+LAZY_MODULES = [
+    "image_display",
+    "ascii_art",
+    "k_means_image",
+    "format_conversion",
+    "tone_adjust",
+    "blur_detection",
+    "color_lut",
+    "wand.image"
+]
 
-from PIL.ImageQt import ImageQt
-from wand.image import Image as ImageWand
-import sys
+WARP_MODES = ["Rotate hues", "Swap channels", "Palette", ".cube file"]  # See color_lut.create_lut
+CHANNEL_ORDERS = ["RBG", "GRB", "GBR", "BRG", "BGR"]  # Every reordering of the color channels except the original
 
 SUPPORTED_FORMATS = [
     ".png",
@@ -23,6 +39,12 @@ SUPPORTED_FORMATS = [
     ".bmp",
     ".pgm"
 ]
+PREVIEW_SIZE = 400  # Longest side, in pixels, of the shrunken copy of an image used for live previews
+PREVIEW_DELAY = 150  # Milliseconds to wait after the last edit before rendering a live preview
+PREVIEW_ITERATIONS = 8  # Passes of the k-means algorithm used for a preview; the full image runs until convergence
+IDLE_DELAY = 2000  # Milliseconds to wait after the last edit before rendering the full resolution image
+RESCALE_INTERVAL = 16  # Minimum number of milliseconds between rescales while the splitter is dragged (about 60 fps)
+SETTLE_DELAY = 150  # Milliseconds after the splitter stops moving before the image is rescaled smoothly
 
 
 def set_button_length(btns):
@@ -51,6 +73,78 @@ def remove_spacing(layouts):
         layout.setSpacing(0)
 
 
+def create_slider(minimum, maximum, value):
+    """Creates a horizontal slider that ranges from minimum to maximum and starts at value"""
+    slider = QSlider(Qt.Horizontal)
+    slider.setRange(minimum, maximum)
+    slider.setValue(value)
+
+    return slider
+
+
+def load_module(name):
+    """Imports a module, or returns it if it has already been imported"""
+    return importlib.import_module(name)
+
+
+def preload_module(label, name, cancel_token=None, progress=None):
+    """Same as load_module but meant to be run by a Worker, so the module is imported in the background"""
+    return load_module(name), label
+
+
+def report_startup_times():
+    """Prints how long it took for the window to appear, followed by how long each module in LAZY_MODULES takes to
+    import. Modules are imported in order, so time spent on a dependency shared with an earlier module isn't counted
+    again"""
+    print("Window shown after {:.0f} ms".format((time.perf_counter() - STARTUP_TIME) * 1000))
+
+    for name in LAZY_MODULES:
+        t0 = time.perf_counter()
+        try:
+            load_module(name)
+        except ImportError as err:
+            print("{:<20}not available ({})".format(name, str(err).splitlines()[0]))
+            continue
+        t1 = time.perf_counter()
+
+        print("{:<20}{:.0f} ms".format(name, (t1 - t0) * 1000))
+
+
+def create_timer(interval, func):
+    """Creates a single-shot QTimer that calls func after interval milliseconds; starting the timer again before it
+    fires postpones the call, which is used to wait until the user has stopped editing"""
+    timer = QTimer()
+    timer.setSingleShot(True)
+    timer.setInterval(interval)
+    timer.timeout.connect(func)
+
+    return timer
+
+
+class LivePreview:
+    """Renders a shrunken preview of a panel's image shortly after the user edits any of the panel's inputs,
+    and the full resolution image once the user has stopped editing for a while"""
+    def __init__(self, checkbox, preview_func, full_func):
+        self.checkbox = checkbox  # The "Live preview" check box of the panel; nothing is rendered while it's unchecked
+        self.preview_timer = create_timer(PREVIEW_DELAY, preview_func)
+        self.idle_timer = create_timer(IDLE_DELAY, full_func)
+
+        checkbox.toggled.connect(self.schedule)
+
+    def schedule(self):
+        """Called every time one of the panel's inputs changes"""
+        if self.checkbox.isChecked():
+            self.preview_timer.start()
+            self.idle_timer.start()
+        else:
+            self.stop()
+
+    def stop(self):
+        """Stops any pending render; used when the user asks for the full resolution image themselves"""
+        self.preview_timer.stop()
+        self.idle_timer.stop()
+
+
 def unexpected_error(error):
     """Takes an error from a try-except and displays that error to the user"""
     msg = "An unexpected error occurred.\nError: " + str(error)
@@ -65,9 +159,12 @@ class MainWindow(QMainWindow):
         self.setMinimumWidth(1300)
 
         self.img_to_save = None
-        self.cur_pix = None
-        self.q_img = None  # A variable storing the current image to be displayed as a QImage object; used to avoid errors with garbage collection
+        self.pixmaps = None  # ScaledPixmapCache of the image currently displayed
+        self.rescale_timer = create_timer(RESCALE_INTERVAL, lambda: self.dynamic_scaling(False))
+        self.settle_timer = create_timer(SETTLE_DELAY, self.dynamic_scaling)
         self.threadpool = QThreadPool()
+        self.jobs = {}  # The latest Worker started for each panel, keyed by the panel's status label
+        self.proxies = {}  # Shrunken copies of the images live previews are rendered from, keyed by the path label
 
         # Create main layout of app
         widget = QWidget()  # Main widget of the app that'll hold the top-level layout
@@ -80,6 +177,9 @@ class MainWindow(QMainWindow):
         status_bar = QStatusBar()
         self.setStatusBar(status_bar)
 
+        self.save_status = QLabel()  # Shows the progress of saving images in the bottom right corner
+        status_bar.addPermanentWidget(self.save_status)
+
         toolbar = QToolBar()
         self.addToolBar(toolbar)
 
@@ -88,6 +188,19 @@ class MainWindow(QMainWindow):
         save_btn.pressed.connect(lambda format=".png": self.save_img(format))
         toolbar.addWidget(save_btn) # Add the save button to the toolbar
 
+        self.encoder_profile = QComboBox()
+        for profile in ENCODER_PROFILES:
+            self.encoder_profile.addItem(profile)
+        self.encoder_profile.setCurrentText(DEFAULT_PROFILE)
+        self.encoder_profile.setStatusTip("Fast: saves and converts images quickly. Small: takes longer but creates "
+                                          "smaller files")
+        toolbar.addWidget(self.encoder_profile)
+
+        self.use_processes = QCheckBox("Run jobs in separate processes")
+        self.use_processes.setStatusTip("Run image creation in separate processes so several jobs can run at once "
+                                        "without slowing down the app; progress is not shown in this mode")
+        toolbar.addWidget(self.use_processes)
+
         # Create the button panel with their layouts
         btn_layout = QVBoxLayout()  # A vertical layout to horizontally align the buttons on the left of the app
         btn_panel = QHBoxLayout()  # A horizontal layout to position btn_layout with a vertical line serving as a border
@@ -103,6 +216,10 @@ class MainWindow(QMainWindow):
         convert_btn.setStatusTip("Convert your image file from one type to the next. Supported file types: png, jpg, "
                                  " ASCII ppm, binary ppm, bmp, and pgm")
         k_btn.setStatusTip("Take any image and recreate that image using just its core colors")
+        brighten_btn.setStatusTip("Adjust the brightness, contrast, gamma and levels of an image")
+        detect_btn.setStatusTip("Find out how blurry an image is and which parts of it are out of focus, or rank a "
+                                "whole folder of images from blurriest to sharpest")
+        warp_btn.setStatusTip("Shift, swap or replace the colors of an image, or apply a .cube color grading LUT")
 
         btns = [ascii_btn, convert_btn, k_btn, brighten_btn, detect_btn, warp_btn]
         set_button_length(btns)
@@ -143,7 +260,8 @@ class MainWindow(QMainWindow):
         upload_ascii_btn = QPushButton("Upload file")
         ascii_layout.addRow(upload_ascii_btn, self.ascii_path)
 
-        upload_ascii_btn.pressed.connect(lambda label=self.ascii_path: self.open_img(label))
+        upload_ascii_btn.pressed.connect(lambda label=self.ascii_path: self.open_img(label, self.ascii_preview,
+                                                                                         self.ascii_status))
 
         self.start_color = QLineEdit()
         ascii_layout.addRow(QLabel("Start color:"), self.start_color)
@@ -154,6 +272,13 @@ class MainWindow(QMainWindow):
         self.bgcolor = QLineEdit()
         ascii_layout.addRow(QLabel("Background color:"), self.bgcolor)
 
+        ascii_live = QCheckBox("Live preview")
+        ascii_layout.addRow(ascii_live)
+
+        self.ascii_preview = LivePreview(ascii_live, self.preview_ascii_art, lambda: self.create_ascii_art(False))
+        for line_edit in [self.start_color, self.end_color, self.bgcolor]:
+            line_edit.textChanged.connect(self.ascii_preview.schedule)
+
         create_btn_ascii = QPushButton("Create ASCII Art")
         self.ascii_status = QLabel()
 
@@ -166,15 +291,17 @@ class MainWindow(QMainWindow):
 
         stack.addWidget(ascii_widget)
         ascii_btn.pressed.connect(lambda n=1: stack.setCurrentIndex(n))
+        ascii_btn.pressed.connect(lambda: self.preload(self.ascii_status, "ascii_art", "image_display"))
 
         # Convert file format layout
         convert_layout = QFormLayout()
 
         upload_convert_btn = QPushButton("Upload")
         self.convert_path = QLabel()
+        self.convert_paths = []  # Every file selected for conversion; several files can be converted at once
         convert_layout.addRow(upload_convert_btn, self.convert_path)
 
-        upload_convert_btn.pressed.connect(lambda label=self.convert_path: self.open_img(label))
+        upload_convert_btn.pressed.connect(self.open_convert_imgs)
 
         create_convert_btn = QPushButton("Convert file format to")
         create_convert_btn.pressed.connect(self.convert_file_format)
@@ -185,11 +312,15 @@ class MainWindow(QMainWindow):
 
         convert_layout.addRow(create_convert_btn, self.selected_format)
 
+        self.convert_status = QLabel()
+        convert_layout.addRow(self.convert_status)
+
         convert_widget = QWidget()
         convert_widget.setLayout(convert_layout)
 
         stack.addWidget(convert_widget)
         convert_btn.pressed.connect(lambda n=2: stack.setCurrentIndex(n))
+        convert_btn.pressed.connect(lambda: self.preload(self.convert_status, "format_conversion"))
 
         # k means layout
         k_layout = QFormLayout()
@@ -198,7 +329,7 @@ class MainWindow(QMainWindow):
         self.k_path = QLabel()
         k_layout.addRow(upload_k_btn, self.k_path)
 
-        upload_k_btn.pressed.connect(lambda label=self.k_path: self.open_img(label))
+        upload_k_btn.pressed.connect(lambda label=self.k_path: self.open_img(label, self.k_preview, self.k_status))
 
         self.num_select = QComboBox()
         for i in range(2, 11):
@@ -210,18 +341,149 @@ class MainWindow(QMainWindow):
         create_k_btn.pressed.connect(self.create_k_img)
 
         k_layout.addRow(QLabel("Select the number of colors you would like your image averaged to"), self.num_select)
+        k_live = QCheckBox("Live preview")
+        k_layout.addRow(k_live)
         k_layout.addRow(create_k_btn, self.k_status)
 
+        self.k_preview = LivePreview(k_live, self.preview_k_img, lambda: self.create_k_img(False))
+        self.num_select.currentIndexChanged.connect(self.k_preview.schedule)
+
         k_widget = QWidget()
         k_widget.setLayout(k_layout)
 
         stack.addWidget(k_widget)
         k_btn.pressed.connect(lambda n=3: stack.setCurrentIndex(n))
+        k_btn.pressed.connect(lambda: self.preload(self.k_status, "k_means_image", "image_display"))
+
+        # Brighten layout
+        brighten_layout = QFormLayout()
+
+        upload_brighten_btn = QPushButton("Upload file")
+        self.brighten_path = QLabel()
+        self.tone_proxy = None  # Shrunken copy of the uploaded image that the sliders are previewed on
+        brighten_layout.addRow(upload_brighten_btn, self.brighten_path)
+
+        upload_brighten_btn.pressed.connect(self.open_brighten_img)
+
+        # Brightness, contrast and gamma are in hundredths; the black and white points are grayscale values
+        self.brightness_slider = create_slider(0, 300, 100)
+        self.contrast_slider = create_slider(0, 300, 100)
+        self.gamma_slider = create_slider(10, 300, 100)
+        self.black_slider = create_slider(0, 254, 0)
+        self.white_slider = create_slider(1, 255, 255)
+
+        brighten_layout.addRow(QLabel("Brightness:"), self.brightness_slider)
+        brighten_layout.addRow(QLabel("Contrast:"), self.contrast_slider)
+        brighten_layout.addRow(QLabel("Gamma:"), self.gamma_slider)
+        brighten_layout.addRow(QLabel("Black point:"), self.black_slider)
+        brighten_layout.addRow(QLabel("White point:"), self.white_slider)
+
+        for slider in [self.brightness_slider, self.contrast_slider, self.gamma_slider, self.black_slider,
+                       self.white_slider]:
+            slider.valueChanged.connect(self.preview_tones)
+
+        create_brighten_btn = QPushButton("Create and display new image")
+        self.brighten_status = QLabel()
+        brighten_layout.addRow(create_brighten_btn, self.brighten_status)
+
+        create_brighten_btn.pressed.connect(self.create_brightened_img)
+
+        brighten_widget = QWidget()
+        brighten_widget.setLayout(brighten_layout)
+
+        stack.addWidget(brighten_widget)
+        brighten_btn.pressed.connect(lambda n=4: stack.setCurrentIndex(n))
+        brighten_btn.pressed.connect(lambda: self.preload(self.brighten_status, "tone_adjust", "k_means_image",
+                                                          "image_display"))
+
+        # Blur detection layout
+        detect_layout = QFormLayout()
+
+        upload_detect_btn = QPushButton("Upload file")
+        self.detect_path = QLabel()
+        detect_layout.addRow(upload_detect_btn, self.detect_path)
+
+        upload_detect_btn.pressed.connect(lambda label=self.detect_path: self.open_img(label))
+
+        create_detect_btn = QPushButton("Detect blur")
+        self.detect_status = QLabel()
+        detect_layout.addRow(create_detect_btn, self.detect_status)
+
+        create_detect_btn.pressed.connect(self.detect_blur)
+
+        scan_btn = QPushButton("Rank a folder")
+        scan_btn.setStatusTip("Score every image in a folder and its subfolders and save the ranking as a CSV file")
+        self.scan_status = QLabel()
+        detect_layout.addRow(scan_btn, self.scan_status)
+
+        scan_btn.pressed.connect(self.scan_folder)
+
+        detect_widget = QWidget()
+        detect_widget.setLayout(detect_layout)
+
+        stack.addWidget(detect_widget)
+        detect_btn.pressed.connect(lambda n=5: stack.setCurrentIndex(n))
+        detect_btn.pressed.connect(lambda: self.preload(self.detect_status, "blur_detection", "image_display"))
+
+        # Warp colors layout
+        warp_layout = QFormLayout()
+
+        upload_warp_btn = QPushButton("Upload file")
+        self.warp_path = QLabel()
+        warp_layout.addRow(upload_warp_btn, self.warp_path)
+
+        upload_warp_btn.pressed.connect(lambda label=self.warp_path: self.open_img(label, self.warp_preview,
+                                                                                       self.warp_status))
+
+        self.warp_mode = QComboBox()
+        for mode in WARP_MODES:
+            self.warp_mode.addItem(mode)
+        warp_layout.addRow(QLabel("Warp:"), self.warp_mode)
+
+        self.hue_slider = create_slider(-180, 180, 0)
+        warp_layout.addRow(QLabel("Hue rotation (degrees):"), self.hue_slider)
+
+        self.channel_order = QComboBox()
+        for order in CHANNEL_ORDERS:
+            self.channel_order.addItem(order)
+        warp_layout.addRow(QLabel("New channel order:"), self.channel_order)
+
+        self.palette = QLineEdit()
+        self.palette.setPlaceholderText("e.g. navy, gold, #f0e6d2")
+        warp_layout.addRow(QLabel("Palette colors:"), self.palette)
+
+        upload_cube_btn = QPushButton("Upload .cube file")
+        self.cube_path = QLabel()
+        warp_layout.addRow(upload_cube_btn, self.cube_path)
+
+        upload_cube_btn.pressed.connect(self.open_cube)
+
+        warp_live = QCheckBox("Live preview")
+        warp_layout.addRow(warp_live)
+
+        create_warp_btn = QPushButton("Create and display new image")
+        self.warp_status = QLabel()
+        warp_layout.addRow(create_warp_btn, self.warp_status)
+
+        create_warp_btn.pressed.connect(self.create_warped_img)
+
+        self.warp_preview = LivePreview(warp_live, self.preview_warped_img, lambda: self.create_warped_img(False))
+        self.warp_mode.currentIndexChanged.connect(self.warp_preview.schedule)
+        self.hue_slider.valueChanged.connect(self.warp_preview.schedule)
+        self.channel_order.currentIndexChanged.connect(self.warp_preview.schedule)
+        self.palette.textChanged.connect(self.warp_preview.schedule)
+
+        warp_widget = QWidget()
+        warp_widget.setLayout(warp_layout)
+
+        stack.addWidget(warp_widget)
+        warp_btn.pressed.connect(lambda n=6: stack.setCurrentIndex(n))
+        warp_btn.pressed.connect(lambda: self.preload(self.warp_status, "color_lut", "image_display"))
 
         # Create and set up the splitter
         splitter = QSplitter()
         splitter.setOrientation(QtCore.Qt.Vertical)  # Create a vertical splitter
-        splitter.splitterMoved.connect(self.dynamic_scaling)  # When splitter is moved, execute dynamic_scaling func
+        splitter.splitterMoved.connect(self.splitter_moved)  # When splitter is moved, rescale the image
         splitter.setChildrenCollapsible(True)  # Top and bottom layouts can be completely collapsed
 
         img_widget = QWidget()
@@ -254,8 +516,9 @@ class MainWindow(QMainWindow):
         remove_spacing(all_layouts)
 
     # These functions are related to opening, saving, and displaying image files as well as displaying errors
-    def open_img(self, label):
-        """Opens an image by getting its file path and setting a QLabel's text to that file path"""
+    def open_img(self, label, preview=None, status=None):
+        """Opens an image by getting its file path and setting a QLabel's text to that file path
+        preview is the LivePreview of the panel the image was opened in, if it has one, and status its status label"""
 
         # An array that stores a file path and the types of files that the user can select
         fname = QFileDialog.getOpenFileName(self, "Open Image", "c\\", "Image Files (*.jpg *.png *.bmp *.ppm *.pgm)")
@@ -264,6 +527,44 @@ class MainWindow(QMainWindow):
         path = QFileInfo(fname[0]).filePath()
         label.setText(path)  # Displays the opened file path
 
+        if preview is not None:
+            self.load_proxy(label, status, preview)
+
+    def load_proxy(self, label, status, preview):
+        """Loads the shrunken copy of the image whose path is in label, which the panel's live previews are rendered
+        from so that edits don't reopen the full image; previews are skipped until it has loaded"""
+        self.proxies.pop(label, None)
+
+        path = label.text()
+        if path == "":
+            return
+
+        worker = Worker(load_module("tone_adjust").load_preview, status, path, PREVIEW_SIZE)
+        worker.signals.error.connect(self.display_error)
+        worker.signals.result.connect(lambda proxy, _, label=label, path=path, preview=preview:
+                                      self.proxy_loaded(label, path, proxy, preview))
+
+        self.start_job(worker)
+
+    def proxy_loaded(self, label, path, proxy, preview):
+        """Called once a Worker has loaded the shrunken copy of an image opened in a panel with a live preview"""
+        if label.text() != path:
+            return  # Another image was opened in the meantime
+
+        self.proxies[label] = proxy
+        preview.schedule()
+
+    def open_convert_imgs(self):
+        """Lets the user pick one or more images to convert"""
+        fnames = QFileDialog.getOpenFileNames(self, "Open Images", "c\\",
+                                              "Image Files (*.jpg *.png *.bmp *.ppm *.pgm)")
+
+        self.convert_paths = [QFileInfo(fname).filePath() for fname in fnames[0]]
+        if len(self.convert_paths) > 1:
+            self.convert_path.setText(str(len(self.convert_paths)) + " files selected")
+        else:
+            self.convert_path.setText("".join(self.convert_paths))
+
     def save_img(self, extension):
         """Saves an image with the desired extension"""
         try:
@@ -271,45 +572,115 @@ class MainWindow(QMainWindow):
                 NoticeDialog("There is nothing to save", True)
             else:
                 fname = QFileDialog.getSaveFileName(self, "Save File")
+                if fname[0] == "":
+                    NoticeDialog("Image saving canceled", False)
+                    return
+
                 new_file_name = QFileInfo(fname[0]).filePath() + extension  # Determine new file name by asking user
+                img = self.img_to_save
+
+                # Encoding large images takes a while, so it's done on the thread pool
+                worker = Worker(save_image, self.save_status, img, new_file_name, self.encoder_profile.currentText())
+                worker.signals.progress.connect(self.display_progress)
+                worker.signals.error.connect(lambda error_type, error_msg: unexpected_error(error_msg))
+                worker.signals.result.connect(lambda file_name, label: self.img_saved(img, label))
 
-                self.img_to_save.save(new_file_name)
-                self.img_to_save = None  # Since image has been saved, there is no longer an image to save
-                NoticeDialog("Image was saved successfully", False)
+                self.threadpool.start(worker)
 
-        except ValueError:
-            NoticeDialog("Image saving canceled", False)
         except Exception as err:
             unexpected_error(err)
 
-    def dynamic_scaling(self):
+    def img_saved(self, img, label):
+        """Called once a Worker has finished saving img"""
+        if self.img_to_save is img:
+            self.img_to_save = None  # Since image has been saved, there is no longer an image to save
+
+        label.setText("Image saved")
+        NoticeDialog("Image was saved successfully", False)
+
+    def splitter_moved(self):
+        """Splitters send many move events per frame while being dragged; rescale at most once every
+        RESCALE_INTERVAL milliseconds and rescale smoothly once the splitter stops moving"""
+        if not self.rescale_timer.isActive():
+            self.rescale_timer.start()
+
+        self.settle_timer.start()
+
+    def dynamic_scaling(self, smooth=True):
         """Scales the image as the splitter is moved up and down, keeping aspect ratio of image and scaling
         its width and height"""
-        pix = self.cur_pix  # Current pixmap of the image
+        pixmaps = self.pixmaps  # Current image at different sizes
         display = self.img_display  # The image currently being displayed on screen
 
-        if pix is None:
+        if pixmaps is None:
             return
         else:
             w, h = display.width(), display.height()
-            display.setPixmap(QPixmap(pix.scaled(w, h, Qt.KeepAspectRatio)))
+            display.setPixmap(pixmaps.get(w, h, smooth))
 
-    def display_img(self, display_img, label):
+    def show_img(self, display_img):
+        """Displays a PIL image, scaled to fit the space available"""
+        self.pixmaps = load_module("image_display").ScaledPixmapCache(display_img)
+        self.dynamic_scaling()
+
+    def display_img(self, display_img, label, notify=True):
         """After processing new image art, this function displays the unsaved image, giving the user a preview
         before they decide to save the image"""
         self.img_to_save = display_img  # Image that can be saved is the image displayed
+        self.show_img(display_img)
 
-        self.q_img = ImageQt(display_img)  # Convert from PIL Image to QImage
-        q_pix = QPixmap.fromImage(self.q_img)  # Create QPixmap from QImage
+        label.setText("Process complete")
+        if notify:
+            NoticeDialog("Image created successfully\nHit Ctrl+S to save your image", False)
+        # self.img_display.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
-        self.cur_pix = q_pix  # Only necessary with dynamic scaling
+    def display_preview(self, display_img, label):
+        """Displays a live preview; previews are shrunken copies, so they can't be saved"""
+        self.img_to_save = None
+        self.show_img(display_img)
 
-        self.img_display.setPixmap(QPixmap(q_pix))  # Display the image by setting the pixmap of the label img_display
-        self.dynamic_scaling()
+        label.setText("Preview")
 
-        label.setText("Process complete")
-        NoticeDialog("Image created successfully\nHit Ctrl+S to save your image", False)
-        # self.img_display.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+    def preload(self, label, *names):
+        """Imports the modules a panel needs on the thread pool as soon as the panel is opened, so they're usually
+        ready by the time the user starts a job"""
+        for name in names:
+            if name not in sys.modules:
+                self.threadpool.start(Worker(preload_module, label, name))
+
+    def display_progress(self, label, message):
+        """Shows the progress message of a running job in its panel's status label"""
+        label.setText(message)
+
+    def create_worker(self, func, label, *args, **kwargs):
+        """Creates a Worker, or a ProcessWorker if the user chose to run jobs in separate processes"""
+        if self.use_processes.isChecked():
+            return ProcessWorker(func, label, *args, **kwargs)
+        else:
+            return Worker(func, label, *args, **kwargs)
+
+    def start_display_job(self, worker, notify):
+        """Starts a worker whose result is displayed with display_img; if notify is False, the job was started
+        automatically by a LivePreview, so no dialogs are shown when it finishes or fails"""
+        if notify:
+            worker.signals.error.connect(self.display_error)
+            worker.signals.result.connect(self.display_img)
+        else:
+            worker.signals.result.connect(lambda display_img, label: self.display_img(display_img, label, False))
+
+        self.start_job(worker)
+
+    def start_job(self, worker):
+        """Starts a worker on the thread pool; if the same panel still has a job running, that job is cancelled
+        first since its result would be replaced by the new one anyway"""
+        old_worker = self.jobs.get(worker.label)
+        if old_worker is not None:
+            old_worker.cancel()
+
+        self.jobs[worker.label] = worker
+        worker.signals.progress.connect(self.display_progress)
+
+        self.threadpool.start(worker)
 
     def display_error(self, error_type, error_msg):
         """Displays errors to the user that arise during the execution of threaded functions"""
@@ -330,7 +701,11 @@ class MainWindow(QMainWindow):
             unexpected_error(error_msg)
 
     # The following functions are for image creation/manipulation
-    def create_ascii_art(self):
+    def create_ascii_art(self, notify=True):
+        self.ascii_preview.stop()
+        if not notify and self.ascii_path.text() == "":
+            return  # Started by the live preview before any image was uploaded
+
         self.ascii_status.setText("Creating your image. Please wait.")
 
         label = self.ascii_status
@@ -339,49 +714,77 @@ class MainWindow(QMainWindow):
         end_color = self.end_color.text()
         bgcolor = self.bgcolor.text()
 
-        worker = Worker(ascii_art, label, path, start_color, end_color, bgcolor)
-        worker.signals.error.connect(self.display_error)
-        worker.signals.result.connect(self.display_img)
+        worker = self.create_worker(load_module("ascii_art").ascii_art, label, path, start_color, end_color, bgcolor)
+        self.start_display_job(worker, notify)
 
-        self.threadpool.start(worker)
+    def preview_ascii_art(self):
+        """Renders the ASCII art of a shrunken copy of the uploaded image"""
+        proxy = self.proxies.get(self.ascii_path)
+        if proxy is None:
+            return
+
+        worker = self.create_worker(load_module("ascii_art").ascii_art, self.ascii_status, proxy,
+                                    self.start_color.text(), self.end_color.text(), self.bgcolor.text())
+        worker.signals.result.connect(self.display_preview)
+
+        self.start_job(worker)
 
     def convert_file_format(self):
         """Converts the file format of an image to a different format
         This function does not change the exisiting image but instead creates a copy with the desired format"""
 
         try:
-            path = self.convert_path.text()
-            new_extension = self.selected_format.currentText()
+            paths = self.convert_paths
+            new_format = self.selected_format.currentText()
+            profile = self.encoder_profile.currentText()
+            format_conversion = load_module("format_conversion")
 
             """Using an if-else to catch whether the user uploaded an image or not prior to launching this function
             because using try-except with an AttributeError won't work for some reason"""
-            if path == "":
+            if len(paths) == 0:
                 NoticeDialog("Please upload a file first", True)
                 return
+            elif len(paths) == 1:
+                fname = QFileDialog.getSaveFileName(self, "Save File")
+                if fname[0] == "":
+                    return
+
+                new_file_name = QFileInfo(fname[0]).filePath() + format_conversion.new_extension_for(new_format)
+
+                self.convert_status.setText("Converting your file. Please wait.")
+                worker = Worker(format_conversion.convert_image, self.convert_status, paths[0], new_file_name,
+                                new_format, profile)
             else:
-                # Use Wand to open image since wand supports uncompressed image formats
-                with ImageWand(filename=path) as img:
-                    if new_extension == ".ppm (P3; uncompressed)":
-                        img.format = "ppm"
-                        img.compression = "no"
-                        new_extension = ".ppm"
-                    elif new_extension == ".ppm (P6; compressed)":
-                        img.format = "ppm"
-                        new_extension = ".ppm"
-                    else:
-                        img.format = new_extension[1:]
-
-                    fname = QFileDialog.getSaveFileName(self, "Save File")
-                    new_file_name = QFileInfo(fname[0]).filePath() + new_extension
-
-                    img.save(filename=new_file_name)
+                new_directory = QFileDialog.getExistingDirectory(self, "Save Files To")
+                if new_directory == "":
                     return
 
+                self.convert_status.setText("Converting your files. Please wait.")
+                worker = Worker(format_conversion.convert_files, self.convert_status, paths, new_directory,
+                                new_format, profile)
+
+            worker.signals.error.connect(self.display_error)
+            worker.signals.result.connect(self.file_converted)
+
+            self.start_job(worker)
+
         except Exception as err:
             unexpected_error(err)
 
-    def create_k_img(self):
+    def file_converted(self, new_file_names, label):
+        """Called once a Worker has finished converting one or more files"""
+        label.setText("Process complete")
+        if isinstance(new_file_names, list):
+            NoticeDialog(str(len(new_file_names)) + " files were converted successfully", False)
+        else:
+            NoticeDialog("File was converted successfully", False)
+
+    def create_k_img(self, notify=True):
         """Takes an image and creates a copy with the colors averaged to k number of colors"""
+        self.k_preview.stop()
+        if not notify and self.k_path.text() == "":
+            return  # Started by the live preview before any image was uploaded
+
         self.k_status.setText("Creating your image. Please wait.")
 
         label = self.k_status
@@ -392,19 +795,192 @@ class MainWindow(QMainWindow):
             label.setText("Error")
             NoticeDialog("Please upload a file first", True)
         else:
-            NoticeDialog("This may take a while depending on your computer's processing speed\n"
-                         "The more colors you selected, the longer it will take", False)
+            if notify:
+                NoticeDialog("This may take a while depending on your computer's processing speed\n"
+                             "The more colors you selected, the longer it will take", False)
 
-            worker = Worker(k_means, label, img, k)
-            worker.signals.error.connect(self.display_error)
-            worker.signals.result.connect(self.display_img)
+            worker = self.create_worker(load_module("k_means_image").k_means, label, img, k)
+            self.start_display_job(worker, notify)
+
+    def preview_k_img(self):
+        """Averages the colors of a shrunken copy of the uploaded image"""
+        proxy = self.proxies.get(self.k_path)
+        if proxy is None:
+            return
+
+        k = int(self.num_select.currentText())
+        worker = self.create_worker(load_module("k_means_image").k_means, self.k_status, proxy, k,
+                                    max_iterations=PREVIEW_ITERATIONS)
+        worker.signals.result.connect(self.display_preview)
 
-            self.threadpool.start(worker)
+        self.start_job(worker)
+
+    def open_brighten_img(self):
+        """Opens an image in the Brighten panel and loads the shrunken copy used to preview the sliders"""
+        self.open_img(self.brighten_path)
+        self.tone_proxy = None
+
+        path = self.brighten_path.text()
+        if path == "":
+            return
+
+        worker = Worker(load_module("tone_adjust").load_preview, self.brighten_status, path, PREVIEW_SIZE)
+        worker.signals.error.connect(self.display_error)
+        worker.signals.result.connect(self.tone_proxy_loaded)
+
+        self.start_job(worker)
+
+    def tone_proxy_loaded(self, proxy, label):
+        """Called once a Worker has loaded the shrunken copy of the image opened in the Brighten panel"""
+        self.tone_proxy = proxy
+        self.preview_tones()
+
+    def tone_settings(self):
+        """Returns the brightness, contrast, gamma, black point and white point chosen with the sliders"""
+        return (self.brightness_slider.value() / 100, self.contrast_slider.value() / 100,
+                self.gamma_slider.value() / 100, self.black_slider.value(), self.white_slider.value())
+
+    def preview_tones(self):
+        """Applies the slider settings to the shrunken copy of the image. Only a 256-entry lookup table is
+        built, so this is fast enough to run on every slider movement"""
+        if self.tone_proxy is None:
+            return
+
+        tone_adjust = load_module("tone_adjust")
+        lut = tone_adjust.build_tone_lut(*self.tone_settings())
+
+        self.display_preview(tone_adjust.apply_lut(self.tone_proxy, lut), self.brighten_status)
+
+    def create_brightened_img(self):
+        """Creates a full resolution copy of the image with the slider settings applied"""
+        path = self.brighten_path.text()
+        if path == "":
+            NoticeDialog("Please upload a file first", True)
+            return
+
+        self.brighten_status.setText("Creating your image. Please wait.")
+
+        worker = self.create_worker(load_module("tone_adjust").tone_adjust, self.brighten_status, path,
+                                    *self.tone_settings())
+        self.start_display_job(worker, True)
+
+    def detect_blur(self):
+        """Scores the sharpness of the uploaded image and displays its sharpness heatmap"""
+        path = self.detect_path.text()
+        if path == "":
+            NoticeDialog("Please upload a file first", True)
+            return
+
+        self.detect_status.setText("Detecting blur. Please wait.")
+
+        worker = Worker(load_module("blur_detection").detect_blur, self.detect_status, path)
+        worker.signals.error.connect(self.display_error)
+        worker.signals.result.connect(self.blur_detected)
+
+        self.start_job(worker)
+
+    def blur_detected(self, result, label):
+        """Called once a Worker has scored an image; result holds the heatmap and the sharpness score"""
+        heatmap, score = result
+        self.display_img(heatmap, label, False)
+
+        label.setText("Sharpness: {:.1f} (red areas are blurrier than green ones)".format(score))
+
+    def scan_folder(self):
+        """Ranks every image in a folder from blurriest to sharpest and saves the ranking as a CSV file"""
+        directory = QFileDialog.getExistingDirectory(self, "Folder To Scan")
+        if directory == "":
+            return
+
+        fname = QFileDialog.getSaveFileName(self, "Save Ranking", "", "CSV Files (*.csv)")
+        if fname[0] == "":
+            return
+
+        csv_path = QFileInfo(fname[0]).filePath()
+        if not csv_path.lower().endswith(".csv"):
+            csv_path += ".csv"
+
+        self.scan_status.setText("Scanning your images. Please wait.")
+
+        worker = Worker(load_module("blur_detection").scan_directory, self.scan_status, directory, csv_path)
+        worker.signals.error.connect(self.display_error)
+        worker.signals.result.connect(self.folder_scanned)
+
+        self.start_job(worker)
+
+    def folder_scanned(self, scores, label):
+        """Called once a Worker has ranked a folder of images"""
+        label.setText("Process complete")
+        NoticeDialog(str(len(scores)) + " images were ranked successfully", False)
+
+    def open_cube(self):
+        """Lets the user pick the .cube file used by the ".cube file" warp"""
+        fname = QFileDialog.getOpenFileName(self, "Open LUT", "c\\", "LUT Files (*.cube)")
+        if fname[0] == "":
+            return
+
+        self.cube_path.setText(QFileInfo(fname[0]).filePath())
+        self.warp_mode.setCurrentText(".cube file")
+        self.warp_preview.schedule()
+
+    def warp_setting(self):
+        """Returns the selected warp mode along with the setting color_lut.create_lut needs for it"""
+        mode = self.warp_mode.currentText()
+
+        if mode == "Rotate hues":
+            return mode, self.hue_slider.value()
+        elif mode == "Swap channels":
+            return mode, self.channel_order.currentText()
+        elif mode == "Palette":
+            return mode, self.palette.text()
+        else:
+            return mode, self.cube_path.text()
+
+    def create_warped_img(self, notify=True):
+        """Takes an image and creates a copy with its colors mapped through a 3D lookup table"""
+        self.warp_preview.stop()
+        path = self.warp_path.text()
+
+        if path == "":
+            if notify:
+                NoticeDialog("Please upload a file first", True)
+            return
+
+        mode, setting = self.warp_setting()
+        if mode == ".cube file" and setting == "":
+            if notify:
+                NoticeDialog("Please upload a .cube file first", True)
+            return
+
+        self.warp_status.setText("Creating your image. Please wait.")
+
+        worker = self.create_worker(load_module("color_lut").warp_colors, self.warp_status, path, mode, setting)
+        self.start_display_job(worker, notify)
+
+    def preview_warped_img(self):
+        """Warps the colors of a shrunken copy of the uploaded image"""
+        proxy = self.proxies.get(self.warp_path)
+        mode, setting = self.warp_setting()
+        if proxy is None or (mode == ".cube file" and setting == ""):
+            return
+
+        worker = self.create_worker(load_module("color_lut").warp_colors, self.warp_status, proxy, mode, setting)
+        worker.signals.result.connect(self.display_preview)
+
+        self.start_job(worker)
 
 
 if __name__ == "__main__":
+    freeze_support()  # Needed by the process pool in the PyInstaller executable
+
     app = QApplication(sys.argv)
     win = MainWindow()
     win.show()
-    sys.exit(app.exec())
+
+    if "--startup-times" in sys.argv:
+        QTimer.singleShot(0, report_startup_times)  # Runs once the window has been drawn
+
+    exit_code = app.exec()
+    shutdown_process_pool()
+    sys.exit(exit_code)
 
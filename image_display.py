@@ -0,0 +1,90 @@
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt
+from collections import OrderedDict
+import numpy as np
+
+MIN_LEVEL_SIZE = 256  # Images are halved until their longest side is below this size, see ScaledPixmapCache
+CACHE_SIZE = 8  # How many scaled pixmaps are remembered
+
+QIMAGE_FORMATS = {
+    "RGBA": QImage.Format_RGBA8888,
+    "RGB": QImage.Format_RGB888,
+    "L": QImage.Format_Grayscale8
+}
+
+
+def to_qimage(img):
+    """
+    Creates a QImage that reads directly from an image's pixel buffer instead of copying it
+
+    :param img: A PIL image or a 3-dimensional (2-dimensional for grayscale) numpy array of 8-bit values
+    :return: The QImage along with the numpy array holding its pixels; the array has to be kept alive for as
+    long as the QImage is used
+    """
+    if isinstance(img, np.ndarray):
+        buffer = np.ascontiguousarray(img)  # Only copies if the array isn't laid out row by row already
+    else:
+        if img.mode not in QIMAGE_FORMATS:
+            img = img.convert("RGBA")
+        buffer = np.asarray(img)  # The one copy needed to get the pixels out of PIL
+
+    height, width = buffer.shape[0], buffer.shape[1]
+    channels = 1 if buffer.ndim == 2 else buffer.shape[2]
+    mode = {1: "L", 3: "RGB", 4: "RGBA"}[channels]
+
+    q_img = QImage(buffer, width, height, buffer.strides[0], QIMAGE_FORMATS[mode])
+
+    return q_img, buffer
+
+
+class ScaledPixmapCache:
+    """Holds the pixmap of the displayed image along with copies of it at lower resolutions
+
+    Scaling a very large pixmap down to the size of the window is slow, so the image is also kept at half, a quarter,
+    an eighth, ... of its size (mip levels), built the first time they're needed. A scaled pixmap is made from the
+    smallest level that's still at least as large as the requested size, and the last few results are remembered"""
+
+    def __init__(self, img):
+        self.q_img, self.buffer = to_qimage(img)  # self.buffer keeps the pixels of self.q_img alive
+        self.levels = [QPixmap.fromImage(self.q_img)]
+        self.scaled = OrderedDict()  # (width, height, smooth) -> scaled pixmap, oldest first
+
+    def level_for(self, width, height):
+        """Returns the smallest mip level that can be scaled down to fit within width by height pixels"""
+        level = self.levels[0]
+        i = 0
+
+        # The next level is half the size of the current one, so it's large enough as long as the image is being
+        # shrunk to half its size or less
+        while min(width / level.width(), height / level.height()) <= 0.5 and \
+                max(level.width(), level.height()) >= 2 * MIN_LEVEL_SIZE:
+            i += 1
+            if i == len(self.levels):
+                half = level.scaled(level.width() // 2, level.height() // 2, Qt.KeepAspectRatio,
+                                    Qt.SmoothTransformation)
+                self.levels.append(half)
+
+            level = self.levels[i]
+
+        return level
+
+    def get(self, width, height, smooth=True):
+        """
+        Returns the image scaled to fit within width by height pixels, keeping its aspect ratio
+
+        :param smooth: Whether to use smooth (bilinear) scaling; fast scaling is used while the user is still resizing
+        """
+        key = (width, height, smooth)
+
+        if key in self.scaled:
+            self.scaled.move_to_end(key)
+            return self.scaled[key]
+
+        transformation = Qt.SmoothTransformation if smooth else Qt.FastTransformation
+        pix = self.level_for(width, height).scaled(width, height, Qt.KeepAspectRatio, transformation)
+
+        self.scaled[key] = pix
+        if len(self.scaled) > CACHE_SIZE:
+            self.scaled.popitem(last=False)
+
+        return pix
@@ -0,0 +1,35 @@
+import numpy as np
+from PIL import Image
+import netpbm
+
+
+def load_pixels(path, mode="RGB", max_size=None):
+    """
+    Opens an image as a writable numpy array of 8-bit values; every tool reads its images through this function
+
+    path can also be an image that was already loaded, such as the shrunken copy live previews are rendered from; a
+    converted copy of it is returned, so the tool can change it freely, and max_size is ignored
+
+    Full size PPM/PGM files are memory-mapped (copy-on-write) rather than decoded. Other images are decoded with PIL;
+    if max_size is given, JPEGs are decoded at a reduced scale before being shrunk, which is much faster
+
+    :param path: The path of an image file, or an image as a numpy array returned by this function
+    :param mode: "RGB" for a (height, width, 3) array or "L" for a (height, width) array of grayscale values
+    :param max_size: If given, the image is shrunk to fit within max_size by max_size pixels
+    """
+    if isinstance(path, np.ndarray):
+        if mode == "RGB":
+            return netpbm.to_rgb(path).copy()
+        return netpbm.to_grayscale(path) if path.ndim == 3 else path.copy()
+
+    if max_size is None:
+        pixels = netpbm.read_rgb(path) if mode == "RGB" else netpbm.read_gray(path)
+        if pixels is not None:
+            return pixels
+
+    with Image.open(path) as img:
+        if max_size is not None:
+            img.draft(mode, (max_size, max_size))  # Lets JPEGs skip decoding at full resolution
+            img.thumbnail((max_size, max_size))
+
+        return np.array(img.convert(mode))
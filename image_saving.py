@@ -0,0 +1,121 @@
+import os
+import stat
+import tempfile
+import zlib
+
+# Pillow encoder settings for each profile, by file format
+# "Fast" favors encoding speed, "Small" favors file size
+ENCODER_PROFILES = {
+    "Fast": {
+        "PNG": {"compress_level": 1, "compress_type": zlib.Z_RLE},  # Run-length matching suits flat, drawn images
+        "JPEG": {"quality": 90},
+    },
+    "Small": {
+        "PNG": {"compress_level": 9, "compress_type": zlib.Z_FILTERED},
+        "JPEG": {"quality": 80, "optimize": True, "progressive": True},
+    }
+}
+DEFAULT_PROFILE = "Fast"
+
+PIL_FORMATS = {
+    ".png": "PNG",
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".bmp": "BMP",
+    ".ppm": "PPM",
+    ".pgm": "PPM"
+}
+
+
+def get_umask():
+    """Returns the process's umask; os.umask can only be read by setting it, so it's set back straight away"""
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return umask
+
+
+UMASK = get_umask()  # Read once at import, since changing the umask briefly isn't safe once other threads are running
+
+
+def temp_file_for(file_name):
+    """Creates an empty temporary file in the same directory as file_name, with the same extension, and returns
+    its path. Writing there first and then renaming means file_name never holds a half-written image"""
+    directory = os.path.dirname(os.path.abspath(file_name))
+    extension = os.path.splitext(file_name)[1]
+
+    fd, temp_name = tempfile.mkstemp(suffix=extension, prefix=".saving-", dir=directory)
+    os.close(fd)
+
+    return temp_name
+
+
+def replace_file(temp_name, file_name, cancel_token=None):
+    """Moves a finished temporary file over file_name in a single step; if the job was cancelled in the meantime,
+    the temporary file is deleted instead
+
+    Temporary files are only readable by their owner, so the file first gets the permissions of the file it replaces,
+    or the permissions a newly created file would normally get"""
+    try:
+        if cancel_token is not None:
+            cancel_token.check()
+
+        try:
+            mode = stat.S_IMODE(os.stat(file_name).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~UMASK
+        os.chmod(temp_name, mode)
+
+        os.replace(temp_name, file_name)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
+def prepare_for_format(img, extension):
+    """Converts an image to a mode its file format can store; JPEG has no alpha channel, PGM is grayscale and PPM is
+    always RGB (Pillow would write a grayscale image as a PGM file even with a .ppm extension)"""
+    if extension == ".pgm":
+        return img.convert("L")
+    elif extension == ".ppm":
+        return img.convert("RGB") if img.mode != "RGB" else img
+    elif PIL_FORMATS[extension] == "JPEG" and img.mode not in ("RGB", "L"):
+        return img.convert("RGB")
+    else:
+        return img
+
+
+def save_image(label, img, file_name, profile=DEFAULT_PROFILE, cancel_token=None, progress=None):
+    """
+    Saves a PIL image; meant to be run by a Worker so the GUI doesn't freeze while large images are encoded
+
+    :param label: A QLabel passed back along with the file name
+    :param img: The PIL image to save
+    :param file_name: Where to save the image; the format is chosen from the file extension
+    :param profile: One of the keys of ENCODER_PROFILES
+    :return: file_name and label
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in PIL_FORMATS:
+        raise ValueError("Unsupported file extension: " + extension)
+
+    img_format = PIL_FORMATS[extension]
+    options = ENCODER_PROFILES[profile].get(img_format, {})
+
+    if progress is not None:
+        progress("Encoding image...")
+
+    img = prepare_for_format(img, extension)
+    temp_name = temp_file_for(file_name)
+
+    try:
+        img.save(temp_name, img_format, **options)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+    if progress is not None:
+        progress("Writing file...")
+    replace_file(temp_name, file_name, cancel_token)
+
+    return file_name, label
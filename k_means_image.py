@@ -3,16 +3,20 @@ import numpy as np
 from math import sqrt
 from PIL import Image
 from ascii_art import get_width_height
+from image_loading import load_pixels
 
 BLACK = (0, 0, 0)
+MAX_ITERATIONS = 100  # Safety net in case the integer averages keep oscillating between two states
+CHUNK_SIZE = 1 << 20  # Number of pixels compared against the k-means at once; keeps memory use bounded
+HISTOGRAM_BINS = 8  # Number of bins per color channel used to compare the colors of two images
+SHIFT_THRESHOLD = 0.05  # How much the color distribution has to shift before an image in a sequence is re-clustered
 
 
-def get_ascii_data(file_name):
-    """Returns a 3 dimensional numpy array of an image with colors represented in RGB format"""
-    img = Image.open(file_name).convert("RGB")
-    img_data = np.array(img)
-
-    return img_data
+def get_ascii_data(file_name, max_size=None):
+    """Returns a 3 dimensional numpy array of an image with colors represented in RGB format
+    file_name can also be an image that was already loaded as a numpy array, which is copied
+    If max_size is given, the image is shrunk to fit within max_size by max_size pixels"""
+    return load_pixels(file_name, "RGB", max_size)
 
 
 def random_color():
@@ -196,40 +200,182 @@ def create_image(cur_img, k_means):
     return Image.fromarray(cur_img)
 
 
-def k_means(label, img, k):
-    """Takes an image and averages it to k number of colors"""
-    img_data = get_ascii_data(img)  # Converts data into ASCII RGB format represented as a numpy array
-    k_means = create_k_means(k)
-    # cluster = create_empty_cluster(k)
-    # k_means = initialize(k, cluster, img_data)
-    different = True
-    while different:
-        cluster_list = group_colors(img_data, k_means)
-        new_k_means = update_k_means(cluster_list)
+def nearest_means(pixels, k_means):
+    """
+    Vectorized version of color_distance that works on many pixels at once
 
-        different = is_different(k_means, new_k_means)
-        k_means = new_k_means
+    :param pixels: An (n, 3) numpy array of RGB colors
+    :param k_means: A k-long list of color averages
+    :return: An n-long numpy array storing, for every pixel, the index of the closest color average
+    """
+    means = np.array(k_means, dtype=np.float32)
+    mean_lengths = (means ** 2).sum(axis=1)
+    indices = np.empty(len(pixels), dtype=np.intp)
 
-    return create_image(img_data, k_means), label
+    for start in range(0, len(pixels), CHUNK_SIZE):
+        chunk = pixels[start:start + CHUNK_SIZE].astype(np.float32)
 
+        # Squared distance without the pixel's own squared length, which is the same for every average and so doesn't
+        # change which one is closest. Every value stays below 2 ** 24, so float32 gives exact results
+        distance = mean_lengths - 2 * (chunk @ means.T)
+        best_index = distance.argmin(axis=1)  # Ties go to the first average, just like list.index in color_distance
 
-def execute_infile(img, new_file_name, k):
-    """Same as the function k_means but meant for infile use"""
-    img_data = get_ascii_data(img)
+        indices[start:start + CHUNK_SIZE] = best_index
+
+    return indices
+
+
+def update_means(pixels, indices, k):
+    """
+    Vectorized version of update_k_means
+
+    :param pixels: An (n, 3) numpy array of RGB colors
+    :param indices: The index of the closest color average for every pixel, as returned by nearest_means
+    :param k: The number of color averages
+    :return: A new k-long list of color averages; empty clusters become black just like in average_color
+    """
+    counts = np.bincount(indices, minlength=k)
+    sums = [np.bincount(indices, weights=pixels[:, channel], minlength=k) for channel in range(3)]
+
+    new_k_means = []
+    for i in range(0, k):
+        if counts[i] == 0:
+            new_k_means.append(BLACK)
+        else:
+            new_k_means.append(tuple(int(channel_sum[i]) // int(counts[i]) for channel_sum in sums))
+
+    return new_k_means
 
-    k_means = create_k_means(k)
-    # cluster = create_empty_cluster(k)
 
-    # k_means = initialize(k, cluster, img_data)
+def run_k_means(pixels, k_means, cancel_token=None, progress=None, max_iterations=MAX_ITERATIONS):
+    """
+    Groups the pixels and updates the averages until the averages no longer change
+
+    :param pixels: An (n, 3) numpy array of RGB colors
+    :param k_means: The color averages to start from; random colors or the result of a previous run
+    :param cancel_token: Optional CancelToken from multithreading; checked before every iteration
+    :param progress: Optional function that's called with a message at the start of every iteration
+    :param max_iterations: Stops after this many iterations even if the averages are still changing
+    :return: The final k-long list of color averages
+    """
     different = True
-    while different:
-        cluster_list = group_colors(img_data, k_means)
-        new_k_means = update_k_means(cluster_list)
+    iterations = 0
+
+    while different and iterations < max_iterations:
+        if cancel_token is not None:
+            cancel_token.check()
+        if progress is not None:
+            progress("Grouping colors... pass " + str(iterations + 1))
+
+        indices = nearest_means(pixels, k_means)
+        new_k_means = update_means(pixels, indices, len(k_means))
 
         different = is_different(k_means, new_k_means)
         k_means = new_k_means
+        iterations += 1
+
+    return k_means
+
+
+def remap_image(img_data, k_means):
+    """
+    Vectorized version of create_image; unlike create_image, the original numpy array is left untouched
+
+    :param img_data: A 3-dimensional numpy array representing an image in RGB format
+    :param k_means: A k-long list of color averages
+    :return: A PIL image object where every pixel has been replaced by its closest color average
+    """
+    indices = nearest_means(img_data.reshape(-1, 3), k_means)
+    palette = np.array(k_means, dtype=np.uint8)
+
+    return Image.fromarray(palette[indices].reshape(img_data.shape))
+
+
+def color_histogram(pixels, bins=HISTOGRAM_BINS):
+    """
+    Creates a coarse, normalized color histogram used to tell whether two images have similar colors
+
+    :param pixels: An (n, 3) numpy array of RGB colors
+    :param bins: The number of bins per color channel; must be a power of two no larger than 256
+    :return: A numpy array of length bins ** 3 whose values add up to 1
+    """
+    shift = 8 - (bins.bit_length() - 1)  # Number of low bits dropped from every channel
+
+    binned = (pixels >> shift).astype(np.intp)
+    bin_index = (binned[:, 0] * bins + binned[:, 1]) * bins + binned[:, 2]
+
+    return np.bincount(bin_index, minlength=bins ** 3) / len(pixels)
+
+
+def histogram_shift(old_histogram, new_histogram):
+    """Returns the fraction of pixels that would have to change color bins to turn one histogram into
+    the other; 0 means identical color distributions and 1 means no colors in common"""
+    return np.abs(old_histogram - new_histogram).sum() / 2
+
+
+def k_means(label, img, k, init_means=None, max_size=None, max_iterations=MAX_ITERATIONS, cancel_token=None,
+            progress=None):
+    """Takes an image and averages it to k number of colors
+    img is the path of the image, or the image as a numpy array (see load_pixels), such as a live preview's proxy
+    If init_means is given, the algorithm starts from those averages instead of random colors
+    If max_size is given, the image is shrunk to fit within max_size by max_size pixels; together with a low
+    max_iterations, this is used for quick previews"""
+    img_data = get_ascii_data(img, max_size)  # Converts data into ASCII RGB format represented as a numpy array
+
+    if init_means is None:
+        init_means = create_k_means(k)
+
+    k_means = run_k_means(img_data.reshape(-1, 3), init_means, cancel_token, progress, max_iterations)
+
+    if cancel_token is not None:
+        cancel_token.check()
+
+    return remap_image(img_data, k_means), label
+
+
+def k_means_sequence(label, imgs, k, threshold=SHIFT_THRESHOLD):
+    """
+    Averages a sequence of similar images, such as the frames of an animation, to k number of colors
+
+    Images are processed one at a time as the generator is advanced. The first image is clustered from
+    random colors; every later image starts from the previous averages, which keeps the palette stable
+    between frames and converges in a few iterations. If an image's colors have shifted by no more than
+    threshold since the last clustered image, clustering is skipped and the image is only remapped
+
+    :param label: A QLabel passed back with every image, the same as in k_means
+    :param imgs: An iterable of image file paths
+    :param k: The number of colors every image is averaged to
+    :param threshold: The histogram_shift above which an image is re-clustered
+    :return: A generator yielding a (PIL image, label) tuple for each image in imgs
+    """
+    k_means = None
+    reference_histogram = None  # Histogram of the last image that was actually clustered
+
+    for img in imgs:
+        img_data = get_ascii_data(img)
+        pixels = img_data.reshape(-1, 3)
+        histogram = color_histogram(pixels)
+
+        if k_means is None:
+            k_means = run_k_means(pixels, create_k_means(k))
+            reference_histogram = histogram
+        elif histogram_shift(reference_histogram, histogram) > threshold:
+            k_means = run_k_means(pixels, k_means)  # Warm start from the previous image's averages
+            reference_histogram = histogram
+
+        yield remap_image(img_data, k_means), label
+
+
+def execute_infile(img, new_file_name, k):
+    """Same as the function k_means but meant for infile use"""
+    new_img, _ = k_means(None, img, k)
+    new_img.save(new_file_name)
+
 
-    create_image(img_data, k_means)
+def execute_sequence_infile(imgs, new_file_names, k):
+    """Same as the function k_means_sequence but meant for infile use; saves every image as it is created"""
+    for (new_img, _), new_file_name in zip(k_means_sequence(None, imgs, k), new_file_names):
+        new_img.save(new_file_name)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,53 @@
 from PyQt5.QtCore import *
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+import multiprocessing
+import concurrent.futures
+import os
 import traceback
+import threading
 import sys
 
+POLL_INTERVAL = 0.1  # How often, in seconds, a ProcessWorker checks whether its job has been cancelled
+
+_process_pool = None  # Shared by every ProcessWorker; created the first time it's needed
+_manager = None  # Serves the events used to cancel jobs running in the process pool
+_pool_lock = threading.Lock()  # ProcessWorkers start on several threads at once, so only one may create either object
+
+
+class Cancelled(Exception):
+    """Raised by CancelToken.check once the job it belongs to has been cancelled"""
+
+
+class CancelToken:
+    """Flag shared between the GUI and a worker function, used to stop jobs whose result is no longer needed;
+    worker functions call check() at points where it is safe to stop, such as between rows or iterations
+    event can be a multiprocessing Manager Event, so that a job running in another process can be cancelled too"""
+    def __init__(self, event=None):
+        self._event = threading.Event() if event is None else event
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled()
+
 
 class WorkerSignals(QObject):
     """The different custom signals that are sent out during multi-threading"""
     result = pyqtSignal(object, object)  # The result of every multi-thread function is two objects, img and label
     error = pyqtSignal(object, object)  # Error will return error type and error message, both objects
+    progress = pyqtSignal(object, object)  # Progress returns the label and a message describing how far along the job is
 
 
 class Worker(QRunnable):
-    """Generic multi-thread worker, used to help create new threads"""
+    """Generic multi-thread worker, used to help create new threads
+    func is called with the keyword arguments cancel_token and progress in addition to the arguments given here,
+    so every function run by a Worker has to accept them"""
     def __init__(self, func, label, *args, **kwargs):
         super(QRunnable, self).__init__()
         self.func = func  # The function to execute in the thread
@@ -19,18 +56,176 @@ class Worker(QRunnable):
         self.args = args  # args represents the variables unique to each different function passed to func
         self.kwargs = kwargs
         self.signals = WorkerSignals()  # The signal to be returned
+        self.token = CancelToken()  # Checked by func so that it can stop early once the job is cancelled
+
+    def cancel(self):
+        """Stops the job as soon as func reaches its next check; a cancelled job never emits result or error"""
+        self.token.cancel()
+
+    def report_progress(self, message):
+        """Passed to func as its progress callback"""
+        if not self.token.is_cancelled():
+            self.signals.progress.emit(self.label, message)
+
+    @pyqtSlot()
+    def run(self):
+        if self.token.is_cancelled():  # Job was cancelled while it was still waiting in the thread pool
+            return
+
+        try:
+            img, label = self.func(self.label, *self.args, cancel_token=self.token, progress=self.report_progress,
+                                   **self.kwargs)
+        except Cancelled:
+            return
+        except:
+            if self.token.is_cancelled():
+                return
+
+            self.emit_error()
+        else:
+            if not self.token.is_cancelled():
+                self.signals.result.emit(img, label)
+
+    def emit_error(self):
+        """Reports the exception currently being handled through the error signal"""
+        traceback.print_exc()  # Print error
+        error_type, error_msg = sys.exc_info()[:2]
+
+        self.label.setText("Error")
+        self.signals.error.emit(error_type, error_msg)
+
+
+def get_process_pool():
+    """Returns the process pool used by ProcessWorker, creating it on first use
+    Worker processes are always spawned rather than forked, since forking a process that runs Qt threads is unsafe;
+    this is also what happens on Windows and in the PyInstaller executable, so every platform behaves the same"""
+    global _process_pool
+
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+
+        return _process_pool
+
+
+def get_manager():
+    """Returns the multiprocessing Manager that creates cancellation events for ProcessWorker, starting it on first
+    use"""
+    global _manager
 
+    with _pool_lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context("spawn").Manager()
+
+        return _manager
+
+
+def shutdown_process_pool():
+    """Stops the worker processes; called once when the application closes"""
+    global _process_pool, _manager
+
+    with _pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
+
+
+def create_untracked_shared_memory(size):
+    """Creates a shared memory block that the creating process won't try to free when it exits; used for blocks that
+    are handed to, and freed by, another process"""
+    try:
+        return shared_memory.SharedMemory(create=True, size=size, track=False)  # Python 3.13 and later
+    except TypeError:
+        shm = shared_memory.SharedMemory(create=True, size=size)
+
+        # Only POSIX platforms register blocks with the resource tracker, under the name with a leading slash
+        if os.name == "posix":
+            resource_tracker.unregister("/" + shm.name, "shared_memory")
+
+        return shm
+
+
+def run_in_process(func, args, kwargs, cancel_event):
+    """
+    Runs a worker function inside a worker process. The resulting image's pixels are written to a shared memory block
+    rather than pickling the PIL image and sending it back through a pipe
+
+    :param cancel_event: A Manager Event that's set once the job is cancelled; passed to func as its cancel_token
+    :return: The name of the shared memory block along with the image's mode and size
+    """
+    img, _ = func(None, *args, cancel_token=CancelToken(cancel_event), progress=None, **kwargs)
+    data = img.tobytes()
+
+    # The GUI process unlinks the block once it has read the image
+    shm = create_untracked_shared_memory(max(len(data), 1))
+    shm.buf[:len(data)] = data
+    shm.close()
+
+    return shm.name, img.mode, img.size
+
+
+def read_shared_image(name, mode, size):
+    """Copies the image written by run_in_process out of shared memory and frees the shared memory block"""
+    from PIL import Image  # Only needed with ProcessWorker, so PIL isn't imported when the app starts
+
+    shm = shared_memory.SharedMemory(name=name)
+
+    try:
+        img = Image.frombytes(mode, size, shm.buf)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return img
+
+
+def discard_shared_image(future):
+    """Frees the shared memory of a job whose result is no longer wanted"""
+    if not future.cancelled() and future.exception() is None:
+        name = future.result()[0]
+
+        shm = shared_memory.SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+
+
+class ProcessWorker(Worker):
+    """Same as Worker, but func runs in a separate process so that several jobs can run in parallel without
+    competing for the GIL. func and its arguments must be picklable and func is called with None in place of the label.
+    Progress is not reported. Cancelling a job sets an event that func's cancel_token checks in the worker process,
+    so jobs that have already started stop at their next check and free their slot in the pool"""
     @pyqtSlot()
     def run(self):
+        if self.token.is_cancelled():
+            return
+
+        cancel_event = get_manager().Event()
+        future = get_process_pool().submit(run_in_process, self.func, self.args, self.kwargs, cancel_event)
+
         try:
-            img, label = self.func(self.label, *self.args)
+            while True:
+                try:
+                    name, mode, size = future.result(timeout=POLL_INTERVAL)
+                    break
+                except concurrent.futures.TimeoutError:
+                    if self.token.is_cancelled():
+                        cancel_event.set()
+                        future.cancel()
+                        future.add_done_callback(discard_shared_image)
+                        return
+
+            img = read_shared_image(name, mode, size)
         except:
-            traceback.print_exc()  # Print error
-            error_type, error_msg = sys.exc_info()[:2]
+            if self.token.is_cancelled():
+                return
 
-            self.label.setText("Error")
-            self.signals.error.emit(error_type, error_msg)
+            self.emit_error()
         else:
-            self.signals.result.emit(img, label)
+            if not self.token.is_cancelled():
+                self.signals.result.emit(img, self.label)
 
 
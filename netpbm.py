@@ -0,0 +1,283 @@
+import re
+import numpy as np
+from functools import lru_cache
+
+# Number of color channels and whether the pixel values are stored as text ("plain") or bytes ("raw")
+MAGIC_NUMBERS = {
+    b"P2": (1, "plain"),
+    b"P3": (3, "plain"),
+    b"P5": (1, "raw"),
+    b"P6": (3, "raw")
+}
+CHUNK_SIZE = 1 << 22  # Number of bytes of a plain file read at once
+STRIP_HEIGHT = 256  # Default number of rows per strip
+MAX_LINE_LENGTH = 70  # Plain files shouldn't have lines longer than this
+COMMENT = re.compile(rb"#[^\n]*")
+
+
+class NetpbmHeader:
+    """The information stored at the start of a PGM/PPM file"""
+    def __init__(self, magic, width, height, maxval, offset):
+        self.magic = magic
+        self.width = width
+        self.height = height
+        self.maxval = maxval
+        self.offset = offset  # Number of bytes before the first pixel value
+        self.channels, self.encoding = MAGIC_NUMBERS[magic]
+
+    def shape(self, num_rows=None):
+        """Returns the shape of the numpy array holding num_rows rows of the image (every row by default)"""
+        if num_rows is None:
+            num_rows = self.height
+
+        if self.channels == 1:
+            return num_rows, self.width
+        else:
+            return num_rows, self.width, self.channels
+
+    def dtype(self):
+        """Raw files use one byte per value, or two big-endian bytes if maxval is larger than 255"""
+        return np.dtype(np.uint8) if self.maxval < 256 else np.dtype(">u2")
+
+
+def read_header(f):
+    """
+    Reads the header of a PGM/PPM file
+
+    :param f: A file opened in binary mode, positioned at the start of the file
+    :return: A NetpbmHeader; f is left positioned at the first pixel value
+    """
+    magic = f.read(2)
+    if magic not in MAGIC_NUMBERS:
+        raise ValueError("Not a P2, P3, P5 or P6 file")
+
+    fields = []
+    char = f.read(1)
+
+    while len(fields) < 3:
+        if char == b"#":  # Comments run until the end of the line
+            while char not in (b"\n", b"\r", b""):
+                char = f.read(1)
+        elif char.isspace():
+            char = f.read(1)
+        elif char.isdigit():
+            digits = b""
+            while char.isdigit():
+                digits += char
+                char = f.read(1)
+            fields.append(int(digits))
+        else:
+            raise ValueError("Invalid PGM/PPM header")
+
+    # Exactly one whitespace character separates maxval from the pixel values, and it has already been read
+    width, height, maxval = fields
+    if not 1 <= maxval <= 65535:
+        raise ValueError("The maximum value of a PGM/PPM file must be between 1 and 65535")
+
+    return NetpbmHeader(magic, width, height, maxval, f.tell())
+
+
+def open_header(path):
+    """Returns the NetpbmHeader of a file, or None if the file isn't a P2, P3, P5 or P6 file
+    Raises ValueError if the file starts like one of those but its header is invalid"""
+    with open(path, "rb") as f:
+        if f.read(2) not in MAGIC_NUMBERS:
+            return None
+
+        f.seek(0)
+        return read_header(f)
+
+
+def plain_values(f, chunk_size=CHUNK_SIZE):
+    """
+    Reads the pixel values of a plain (text) file in chunks, so the text is never held in memory all at once
+
+    :param f: A file opened in binary mode, positioned at the first pixel value
+    :return: A generator yielding 1-dimensional numpy arrays of values
+    """
+    leftover = b""
+
+    while True:
+        chunk = f.read(chunk_size)
+        text = leftover + chunk
+
+        if chunk:
+            # Cut at the last line break so no value or comment is split between two chunks
+            cut = text.rfind(b"\n") + 1
+            text, leftover = text[:cut], text[cut:]
+
+        if b"#" in text:
+            text = COMMENT.sub(b"", text)
+
+        if text.strip():
+            yield np.fromstring(text, dtype=np.int64, sep=" ")  # Any whitespace separates values
+
+        if not chunk:
+            return
+
+
+def iter_strips(path, strip_height=STRIP_HEIGHT):
+    """
+    Reads an image a few rows at a time, so images that don't fit in memory can still be processed
+
+    :return: A generator yielding (first row, numpy array) for every strip of at most strip_height rows
+    """
+    header = open_header(path)
+    if header is None:
+        raise ValueError("Not a P2, P3, P5 or P6 file")
+
+    if header.encoding == "raw":
+        pixels = read_netpbm(path, header)
+        for row in range(0, header.height, strip_height):
+            yield row, pixels[row:row + strip_height]
+        return
+
+    dtype = np.uint8 if header.maxval < 256 else np.uint16
+    row_size = header.width * header.channels
+    buffer = np.empty(0, dtype=dtype)
+    row = 0
+
+    with open(path, "rb") as f:
+        f.seek(header.offset)
+
+        for values in plain_values(f):
+            buffer = np.concatenate([buffer, values.astype(dtype)])
+
+            num_rows = min(len(buffer) // row_size, header.height - row)
+            while num_rows >= strip_height or (num_rows > 0 and row + num_rows == header.height):
+                rows = min(num_rows, strip_height)
+                yield row, buffer[:rows * row_size].reshape(header.shape(rows))
+
+                buffer = buffer[rows * row_size:]
+                row += rows
+                num_rows -= rows
+
+    if row < header.height:
+        raise ValueError("File ends before the last row of the image")
+
+
+def read_netpbm(path, header=None):
+    """
+    Reads a PGM/PPM file into a numpy array
+
+    Raw (P5/P6) files are memory-mapped rather than read: pixels are only loaded from disk when they're used, and
+    the array can be written to without changing the file (copy-on-write). Plain (P2/P3) files are parsed in chunks
+
+    :return: A (height, width) array for PGM files or a (height, width, 3) array for PPM files
+    """
+    if header is None:
+        header = open_header(path)
+        if header is None:
+            raise ValueError("Not a P2, P3, P5 or P6 file")
+
+    if header.encoding == "raw":
+        return np.memmap(path, dtype=header.dtype(), mode="c", offset=header.offset, shape=header.shape())
+
+    pixels = np.empty(header.shape(), dtype=np.uint8 if header.maxval < 256 else np.uint16)
+    for row, strip in iter_strips(path):
+        pixels[row:row + len(strip)] = strip
+
+    return pixels
+
+
+def to_8bit(pixels, maxval):
+    """Scales pixel values from 0 to maxval into 0 to 255; arrays that already use that range are returned as is"""
+    if maxval == 255 and pixels.dtype == np.uint8:
+        return pixels
+
+    return ((pixels.astype(np.uint32) * 255 + maxval // 2) // maxval).astype(np.uint8)
+
+
+def to_grayscale(pixels):
+    """Converts an RGB array to grayscale the same way PIL's convert("L") does"""
+    pixels = pixels.astype(np.uint32)
+    gray = (pixels[..., 0] * 19595 + pixels[..., 1] * 38470 + pixels[..., 2] * 7471 + 0x8000) >> 16
+
+    return gray.astype(np.uint8)
+
+
+def to_rgb(pixels):
+    """Repeats grayscale values across three channels; RGB arrays are returned as is"""
+    if pixels.ndim == 3:
+        return pixels
+
+    return np.repeat(pixels[..., np.newaxis], 3, axis=2)
+
+
+def read_rgb(path):
+    """
+    Returns a (height, width, 3) array of 8-bit RGB values for a PGM/PPM file, or None for any other file
+    8-bit P6 files are returned as a memory map without copying any pixels
+    """
+    header = open_header(path)
+    if header is None:
+        return None
+
+    return to_rgb(to_8bit(read_netpbm(path, header), header.maxval))
+
+
+def read_gray(path):
+    """
+    Returns a (height, width) array of 8-bit grayscale values for a PGM/PPM file, or None for any other file
+    8-bit P5 files are returned as a memory map without copying any pixels
+    """
+    header = open_header(path)
+    if header is None:
+        return None
+
+    pixels = to_8bit(read_netpbm(path, header), header.maxval)
+    if header.channels == 3:
+        pixels = to_grayscale(pixels)
+
+    return pixels
+
+
+@lru_cache(maxsize=4)
+def plain_text_tables(maxval):
+    """Returns the text of every value from 0 to maxval followed by a space, and followed by a line break"""
+    value_text = np.array([str(i) + " " for i in range(maxval + 1)])
+    line_end_text = np.array([str(i) + "\n" for i in range(maxval + 1)])
+
+    return value_text, line_end_text
+
+
+def format_plain(values, maxval):
+    """Formats a 1-dimensional array of pixel values as the text of a plain file, ending with a line break"""
+    value_text, line_end_text = plain_text_tables(maxval)
+    per_line = MAX_LINE_LENGTH // (len(str(maxval)) + 1)
+
+    text = value_text[values]
+    text[per_line - 1::per_line] = line_end_text[values[per_line - 1::per_line]]
+    text[-1] = line_end_text[values[-1]]
+
+    return "".join(text.tolist())
+
+
+def write_netpbm_strips(path, width, height, channels, strips, plain=False, maxval=255):
+    """
+    Writes a PGM (channels = 1) or PPM (channels = 3) file from an iterable of strips, so the whole image never has to
+    be in memory at once
+
+    :param strips: An iterable of numpy arrays holding consecutive rows of the image, from top to bottom
+    :param plain: Write the values as text (P2/P3) instead of bytes (P5/P6)
+    """
+    magic = {(1, False): "P5", (3, False): "P6", (1, True): "P2", (3, True): "P3"}[(channels, plain)]
+    dtype = np.dtype(np.uint8) if maxval < 256 else np.dtype(">u2")
+
+    with open(path, "wb") as f:
+        f.write("{}\n{} {}\n{}\n".format(magic, width, height, maxval).encode("ascii"))
+
+        for strip in strips:
+            if plain:
+                f.write(format_plain(strip.reshape(-1).astype(np.intp), maxval).encode("ascii"))
+            else:
+                f.write(np.ascontiguousarray(strip, dtype=dtype).tobytes())
+
+
+def write_netpbm(path, pixels, plain=False, maxval=255, strip_height=STRIP_HEIGHT):
+    """Writes a (height, width) array as a PGM file or a (height, width, 3) array as a PPM file"""
+    height, width = pixels.shape[0], pixels.shape[1]
+    channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+    strips = (pixels[row:row + strip_height] for row in range(0, height, strip_height))
+
+    write_netpbm_strips(path, width, height, channels, strips, plain, maxval)
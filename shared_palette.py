@@ -0,0 +1,130 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from k_means_image import create_k_means, run_k_means, remap_image, get_ascii_data
+from image_saving import save_image
+from image_loading import load_pixels
+
+SAMPLES_PER_IMAGE = 4096  # How many pixels are taken from every image in the collection
+BUFFER_SIZE = 65536  # Maximum number of sampled pixels kept in memory at once, no matter how many images there are
+SAMPLE_SIDE = 512  # Images are decoded at roughly this size while sampling; the full image is never needed
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".pgm")
+
+
+class PixelReservoir:
+    """A fixed-size buffer of RGB pixels that holds a uniform random sample of every pixel added to it
+    (reservoir sampling), no matter how many pixels have been added in total"""
+
+    def __init__(self, size=BUFFER_SIZE, seed=None):
+        self.size = size
+        self.pixels = np.zeros((size, 3), dtype=np.uint8)
+        self.seen = 0  # Total number of pixels that have been added so far
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, pixels):
+        """Adds an (n, 3) numpy array of pixels to the reservoir"""
+        n = len(pixels)
+
+        # While the buffer is not full yet, pixels are simply copied in
+        free = max(0, min(n, self.size - self.seen))
+        self.pixels[self.seen:self.seen + free] = pixels[:free]
+
+        # Afterwards, the i-th pixel seen replaces a random slot with probability size / i
+        positions = self.seen + np.arange(free, n)
+        slots = self.rng.integers(0, positions + 1)
+        keep = slots < self.size
+        self.pixels[slots[keep]] = pixels[free:][keep]
+
+        self.seen += n
+
+    def sample(self):
+        """Returns the sampled pixels as an (n, 3) numpy array"""
+        return self.pixels[:min(self.seen, self.size)]
+
+
+def list_images(directory):
+    """Returns the paths of every supported image file in a directory, sorted by name"""
+    names = sorted(os.listdir(directory))
+
+    return [os.path.join(directory, name) for name in names if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def sample_pixels(file_name, num_samples, rng):
+    """
+    Randomly picks pixels from an image without holding the full resolution image in memory
+
+    :param file_name: Path to the image
+    :param num_samples: The number of pixels to pick; fewer are returned if the image is smaller
+    :param rng: A numpy random Generator
+    :return: An (n, 3) numpy array of RGB colors
+    """
+    pixels = load_pixels(file_name, "RGB", SAMPLE_SIDE).reshape(-1, 3)
+
+    num_samples = min(num_samples, len(pixels))
+
+    return pixels[rng.choice(len(pixels), num_samples, replace=False)]
+
+
+def build_shared_palette(file_names, k, samples_per_image=SAMPLES_PER_IMAGE, buffer_size=BUFFER_SIZE, seed=None):
+    """
+    Creates one k-color palette for a whole collection of images
+
+    Images are read one at a time and a fixed number of pixels from each one is fed into a PixelReservoir,
+    so memory use stays the same however many images there are. The reservoir is clustered only once
+
+    :param file_names: An iterable of image paths
+    :param k: The number of colors in the palette
+    :param samples_per_image: The number of pixels taken from every image
+    :param buffer_size: The size of the PixelReservoir
+    :param seed: Optional seed for the random sampling
+    :return: A k-long list of color averages
+    """
+    reservoir = PixelReservoir(buffer_size, seed)
+
+    for file_name in file_names:
+        reservoir.add(sample_pixels(file_name, samples_per_image, reservoir.rng))
+
+    return run_k_means(reservoir.sample(), create_k_means(k))
+
+
+def apply_palette(file_name, new_file_name, palette):
+    """Recolors a single image using an existing palette and saves it; returns new_file_name"""
+    # save_image converts the image to what the extension can store (grayscale for .pgm) and writes it atomically
+    save_image(None, remap_image(get_ascii_data(file_name), palette), new_file_name)
+
+    return new_file_name
+
+
+def shared_palette(directory, new_directory, k, max_workers=None):
+    """
+    Averages every image in a directory to the same k colors and saves the results in new_directory
+
+    :param directory: The directory holding the original images
+    :param new_directory: The directory the recolored images are saved to, using the same file names
+    :param k: The number of colors in the shared palette
+    :param max_workers: The number of processes used to recolor images; defaults to the number of CPUs
+    :return: The shared palette as a k-long list of color averages
+    """
+    file_names = list_images(directory)
+    palette = build_shared_palette(file_names, k)
+
+    os.makedirs(new_directory, exist_ok=True)
+    new_file_names = [os.path.join(new_directory, os.path.basename(name)) for name in file_names]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Only file names and the palette are sent to the worker processes, never the images themselves
+        for _ in executor.map(apply_palette, file_names, new_file_names, [palette] * len(file_names)):
+            pass
+
+    return palette
+
+
+if __name__ == "__main__":
+    import time
+
+    t0 = time.perf_counter()
+
+    print(shared_palette("imgs", "imgs_palette", 5))
+
+    t1 = time.perf_counter()
+    print("Time elapsed:", t1 - t0, "seconds")
@@ -0,0 +1,70 @@
+import numpy as np
+from PIL import Image
+from functools import lru_cache
+from image_loading import load_pixels
+
+MID_GRAY = 128  # Contrast is increased or decreased around this value
+
+
+@lru_cache(maxsize=64)
+def build_tone_lut(brightness=1.0, contrast=1.0, gamma=1.0, black_point=0, white_point=255):
+    """
+    Combines every tone adjustment into a single 256-entry lookup table, so an image only has to be
+    processed once no matter how many adjustments are made. Adjustments are applied in the order of the parameters
+    below, starting from the last one (levels first, brightness last)
+
+    :param brightness: Multiplies every value; same as PIL's ImageEnhance.Brightness
+    :param contrast: Moves every value away from (above 1) or towards (below 1) MID_GRAY
+    :param gamma: Values above 1 brighten the midtones and values below 1 darken them, leaving black and white as is
+    :param black_point: This value and anything darker becomes black
+    :param white_point: This value and anything brighter becomes white
+    :return: A numpy array of 256 uint8 values; entry i is the new value of a pixel with value i
+    """
+    values = np.arange(256, dtype=np.float64)
+
+    values = (values - black_point) * 255 / max(white_point - black_point, 1)
+    values = np.clip(values, 0, 255)
+
+    if gamma != 1.0:
+        values = 255 * (values / 255) ** (1 / gamma)
+
+    values = MID_GRAY + (values - MID_GRAY) * contrast
+    values = values * brightness
+
+    lut = np.clip(values, 0, 255).astype(np.uint8)  # Truncates like PIL does
+    lut.setflags(write=False)  # The table is shared through the cache, so it must not be changed
+
+    return lut
+
+
+def apply_lut(pixels, lut, out=None):
+    """
+    Replaces every value in a numpy array of 8-bit values with its entry in lut, in a single pass
+
+    :param pixels: A numpy array of uint8 values, of any shape
+    :param lut: A table created by build_tone_lut
+    :param out: Where to write the result; pass pixels itself to adjust the array in place
+    :return: The adjusted array
+    """
+    return np.take(lut, pixels, out=out, mode="clip")  # Indexes are uint8, so clipping never changes them
+
+
+def tone_adjust(label, path, brightness=1.0, contrast=1.0, gamma=1.0, black_point=0, white_point=255,
+                max_size=None, cancel_token=None, progress=None):
+    """Adjusts the tones of an image; meant to be run by a Worker. See build_tone_lut for the parameters
+    If max_size is given, the image is shrunk to fit within max_size by max_size pixels"""
+    lut = build_tone_lut(brightness, contrast, gamma, black_point, white_point)
+
+    pixels = load_pixels(path, "RGB", max_size)
+    if cancel_token is not None:
+        cancel_token.check()
+
+    apply_lut(pixels, lut, out=pixels)
+
+    return Image.fromarray(np.asarray(pixels)), label
+
+
+def load_preview(label, path, max_size, cancel_token=None, progress=None):
+    """Returns a shrunken copy of an image as a numpy array; live previews are rendered from it instead of reopening
+    the full image on every edit"""
+    return load_pixels(path, "RGB", max_size), label